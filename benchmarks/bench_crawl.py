@@ -0,0 +1,250 @@
+"""
+End-to-end crawl throughput: runs the Crawler against a LocalCacheServer
+serving a deterministic SyntheticWeb, sweeping engines, thread counts,
+parse process counts and politeness delays. Each point reports pages/s, p50/p99 per-url latency
+(from get_tbd_url handing a url out to release_host), peak RSS, the
+frontier size over time and the response filter counters.
+
+Every point crawls in its own subprocess so peak RSS is per point; the
+cache server runs in this process. Results are written as JSON, and
+--baseline compares them with an earlier results file, exiting with 1 when
+throughput drops or peak RSS grows by more than --threshold.
+
+Run from the repository root:
+    python -m benchmarks.bench_crawl --threads 1 4 16 --politeness 0 0.05 --output crawl.json
+    python -m benchmarks.bench_crawl --baseline crawl.json
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, SUPPRESS
+from configparser import ConfigParser
+
+from utils.local_cache_server import LocalCacheServer
+from utils.synthetic_web import SyntheticWeb
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_INTERVAL = 0.5
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def current_rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize()
+
+
+def make_timed_frontier(latencies):
+    from crawler.frontier import Frontier
+
+    class TimedFrontier(Frontier):
+        """Records how long each url is out with a worker."""
+        def __init__(self, config, restart):
+            super().__init__(config, restart)
+            self.handed_out = {}
+
+
+        def get_tbd_url(self, timeout=None):
+            url = super().get_tbd_url(timeout)
+            if url is not None:
+                self.handed_out[url] = time.perf_counter()
+            return url
+
+
+        def release_host(self, url):
+            start = self.handed_out.pop(url, None)
+            if start is not None:
+                latencies.append(time.perf_counter() - start)
+            super().release_host(url)
+
+
+        def queued_urls(self):
+            with self.frontier_lock:
+                return sum(len(queue) for queue in self.host_queues.values())
+
+    return TimedFrontier
+
+
+def make_config(point, cache_address, seed_urls):
+    from utils.config import Config
+    cparser = ConfigParser()
+    cparser.read(os.path.join(REPO_ROOT, "config.ini"))
+    cparser["CRAWLER"]["POLITENESS"] = str(point["politeness"])
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(point["threads"])
+    cparser["LOCAL PROPERTIES"]["ENGINE"] = point["engine"]
+    cparser["LOCAL PROPERTIES"]["PARSE_PROCESSES"] = str(point.get("parse_processes", 0))
+    cparser["LOCAL PROPERTIES"]["SAVE"] = "frontier.sqlite"
+    cparser["LOCAL PROPERTIES"]["RESPONSE_CACHE"] = "off"
+    config = Config(cparser)
+    config.cache_server = tuple(cache_address)
+    config.seed_urls = seed_urls
+    return config
+
+
+def run_point(point, cache_address, seed_urls, max_pages, max_seconds):
+    """Crawl one sweep point in the current process and return its metrics."""
+    from crawler import Crawler
+
+    latencies = []
+    config = make_config(point, cache_address, seed_urls)
+    crawler = Crawler(config, True, frontier_factory=make_timed_frontier(latencies))
+    samples = []
+    start = time.perf_counter()
+    crawler.start_async()
+    while any(worker.is_alive() for worker in crawler.workers):
+        elapsed = time.perf_counter() - start
+        samples.append({
+            "seconds": round(elapsed, 2),
+            "frontier_size": crawler.frontier.queued_urls(),
+            "rss_bytes": current_rss(),
+        })
+        if len(latencies) >= max_pages or elapsed >= max_seconds:
+            crawler.stop()
+            break
+        time.sleep(SAMPLE_INTERVAL)
+    crawler.join()
+    elapsed = time.perf_counter() - start
+
+    return dict(point, **{
+        "pages": len(latencies),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(latencies) / elapsed, 2),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        # Of the largest parse process, if any.
+        "peak_child_rss_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+        "frontier_samples": samples,
+        "filter_stats": crawler.filter_stats(),
+    })
+
+
+def point_key(point):
+    key = f"{point['engine']}/threads={point['threads']}/politeness={point['politeness']}"
+    if point.get("parse_processes"):
+        key += f"/parse={point['parse_processes']}"
+    return key
+
+
+def spawn_point(point, cache_address, seed_urls, args):
+    with tempfile.TemporaryDirectory() as run_dir:
+        # DataStorage writes to ../data_storage, so crawl one level down.
+        work_dir = os.path.join(run_dir, "crawl")
+        os.mkdir(work_dir)
+        result_path = os.path.join(run_dir, "result.json")
+        job = {
+            "point": point, "cache_address": cache_address, "seed_urls": seed_urls,
+            "max_pages": args.max_pages, "max_seconds": args.max_seconds, "result_path": result_path,
+        }
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+        with open(os.path.join(run_dir, "crawl.log"), "w") as log:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_crawl", "--run-point", json.dumps(job)],
+                cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+        with open(result_path) as result_file:
+            return json.load(result_file)
+
+
+def compare(results, baseline, threshold):
+    """Return a message for every point that regressed against `baseline`."""
+    baseline_points = {point_key(point): point for point in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = baseline_points.get(point_key(result))
+        if before is None:
+            continue
+        if result["pages_per_sec"] < before["pages_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{point_key(result)}: {result['pages_per_sec']} pages/s, baseline {before['pages_per_sec']}")
+        if result["peak_rss_bytes"] > before["peak_rss_bytes"] * (1 + threshold):
+            regressions.append(
+                f"{point_key(result)}: peak RSS {result['peak_rss_bytes'] / 2 ** 20:.1f} MiB, "
+                f"baseline {before['peak_rss_bytes'] / 2 ** 20:.1f} MiB")
+    return regressions
+
+
+def main(args):
+    web = SyntheticWeb(
+        hosts=args.hosts, pages_per_host=args.pages_per_host, trap_host_rate=args.trap_host_rate,
+        latency_ms=args.latency_ms, seed=args.seed)
+    cache_server = LocalCacheServer(web)
+    cache_address = cache_server.start()
+    points = [
+        {"engine": engine, "threads": threads, "politeness": politeness, "parse_processes": parse_processes}
+        for engine in args.engines for threads in args.threads for politeness in args.politeness
+        for parse_processes in args.parse_processes
+    ]
+    results = []
+    try:
+        for point in points:
+            results.append(spawn_point(point, cache_address, web.seed_urls(), args))
+    finally:
+        cache_server.stop()
+
+    print(f"{'point':<50}{'pages':>7}{'pages/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'RSS MiB':>9}{'frontier':>10}")
+    for result in results:
+        peak_frontier = max((sample["frontier_size"] for sample in result["frontier_samples"]), default=0)
+        print(
+            f"{point_key(result):<50}{result['pages']:>7}{result['pages_per_sec']:>9.1f}"
+            f"{result['latency_p50_ms'] or 0:>9.1f}{result['latency_p99_ms'] or 0:>9.1f}"
+            f"{result['peak_rss_bytes'] / 2 ** 20:>9.1f}{peak_frontier:>10}")
+
+    report = {
+        "parameters": {
+            "hosts": args.hosts, "pages_per_host": args.pages_per_host, "trap_host_rate": args.trap_host_rate,
+            "latency_ms": args.latency_ms, "seed": args.seed,
+            "max_pages": args.max_pages, "max_seconds": args.max_seconds,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.threshold:.0%} against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--engines", nargs="+", default=["threads"], choices=["threads", "asyncio"])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--politeness", nargs="+", type=float, default=[0, 0.05])
+    parser.add_argument("--parse-processes", nargs="+", type=int, default=[0],
+                        help="PARSE_PROCESSES values to sweep; 0 parses in the fetch threads")
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--pages-per-host", type=int, default=100)
+    parser.add_argument("--trap-host-rate", type=float, default=0.1)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-pages", type=int, default=1000, help="stop each point after this many urls")
+    parser.add_argument("--max-seconds", type=float, default=60, help="stop each point after this long")
+    parser.add_argument("--output", type=str, help="write results as JSON to this file")
+    parser.add_argument("--baseline", type=str, help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative regression")
+    parser.add_argument("--run-point", type=str, help=SUPPRESS)
+    args = parser.parse_args()
+    if args.run_point:
+        job = json.loads(args.run_point)
+        result = run_point(job["point"], job["cache_address"], job["seed_urls"], job["max_pages"], job["max_seconds"])
+        with open(job["result_path"], "w") as result_file:
+            json.dump(result, result_file)
+    else:
+        main(args)
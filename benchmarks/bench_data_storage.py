@@ -0,0 +1,100 @@
+"""
+How long crawler threads wait on DataStorage locks while the periodic job
+stores statistics: the old store (sort, serialize and fsync each file under
+its lock, then append the full summary) against snapshot-and-write-behind.
+
+A "worker" thread keeps taking the locks a page update takes and records
+its longest wait while the store runs.
+
+Run from the repository root (writes to ../data_storage, like the crawler):
+    python -m benchmarks.bench_data_storage --urls 1000000 --words 500000
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from argparse import ArgumentParser
+
+from crawler.data_storage import DataStorage
+
+
+def legacy_store(data_storage, word_counts):
+    """store_scraped_data and finalize_data before snapshots: all work under the locks."""
+    directory = data_storage.DATA_STORAGE_DIR
+
+    def write_json(name, data):
+        with open(directory / name, "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    for _ in range(2):  # store_scraped_data, then finalize_data did it all again
+        with data_storage.visited_url_lock:
+            write_json("unique_pages_count.json", len(data_storage.visited_url))
+        with data_storage.longest_page_lock:
+            write_json("longest_content_page.json", data_storage.longest_page)
+        with data_storage.common_words_lock:
+            write_json("top50_common_words.json",
+                       dict(sorted(word_counts.items(), key=lambda item: item[1], reverse=True)[:50]))
+        with data_storage.subdomains_lock:
+            write_json("subdomains_stats.json",
+                       dict(sorted(data_storage.subdomains.items(), key=lambda item: item[1], reverse=True)))
+
+
+def measure(data_storage, store):
+    """Run `store` while a worker thread takes the data locks; return (store ms, worst worker wait ms)."""
+    stop = threading.Event()
+    worst_wait = [0.0]
+    locks = [data_storage.visited_url_lock, data_storage.longest_page_lock,
+             data_storage.common_words_lock, data_storage.subdomains_lock]
+
+    def worker():
+        while not stop.is_set():
+            for lock in locks:
+                start = time.perf_counter()
+                with lock:
+                    worst_wait[0] = max(worst_wait[0], time.perf_counter() - start)
+            time.sleep(0.0005)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    time.sleep(0.05)
+    start = time.perf_counter()
+    store()
+    store_seconds = time.perf_counter() - start
+    time.sleep(0.05)
+    stop.set()
+    thread.join()
+    return store_seconds * 1000, worst_wait[0] * 1000
+
+
+def main(url_count, word_count, subdomain_count):
+    data_storage = DataStorage()
+    data_storage.visited_url.update(f"https://host{i % subdomain_count}.ics.uci.edu/page/{i}" for i in range(url_count))
+    data_storage.subdomains.update({f"host{i}.ics.uci.edu": i for i in range(subdomain_count)})
+    data_storage.longest_page.update({"url": "https://www.ics.uci.edu", "word_count": 12345})
+    word_counts = {f"word{i}": word_count - i for i in range(word_count)}
+    data_storage.common_words.add(word_counts)
+    # As in a running crawl, where a shard holds at most a batch of pages.
+    data_storage.common_words.flush()
+
+    legacy = measure(data_storage, lambda: legacy_store(data_storage, word_counts))
+    snapshot = measure(data_storage, data_storage.store_scraped_data)
+    data_storage.close()
+
+    print(f"{url_count} visited urls, {word_count} distinct words, {subdomain_count} subdomains")
+    print(f"{'store':<28}{'caller ms':>11}{'worst worker wait ms':>22}")
+    print(f"{'locked sort + fsync':<28}{legacy[0]:>11.1f}{legacy[1]:>22.1f}")
+    print(f"{'snapshot + writer thread':<28}{snapshot[0]:>11.1f}{snapshot[1]:>22.1f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--words", type=int, default=500000)
+    parser.add_argument("--subdomains", type=int, default=1000)
+    args = parser.parse_args()
+    main(args.urls, args.words, args.subdomains)
@@ -0,0 +1,131 @@
+"""
+Resuming with persisted content fingerprints: rebuilding the in-memory
+dedup indexes from the mapped md5 and simhash logs (one insert per record,
+what DataStorage did before) against opening the fingerprint tables and
+looking up in their mapped files.
+
+Both must agree on every query: logged digests and near duplicates of
+logged simhashes are found, fresh random ones are not. Memory is what
+Python allocates while opening; the mapped table pages are page cache,
+shared and evictable, and not included.
+
+Run from the repository root:
+    python -m benchmarks.bench_fingerprints --fingerprints 1000000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from crawler.data_storage import MD5_RECORD_SIZE, SIMHASH_RECORD_SIZE, digest_halves
+from crawler.fingerprint_log import FingerprintLog
+from crawler.fingerprint_table import DigestTable, SimhashTable
+from crawler.seen_index import DigestIndex
+from crawler.simhash_index import SimhashIndex
+
+
+def write_logs(directory, digests, simhashes):
+    for name, record_size, records in (("md5.bin", MD5_RECORD_SIZE, digests),
+                                       ("simhash.bin", SIMHASH_RECORD_SIZE, simhashes)):
+        log = FingerprintLog(os.path.join(directory, name), record_size)
+        for record in records:
+            log.append(record)
+        log.close()
+
+
+def open_rebuilt(directory, max_distance):
+    md5_log = FingerprintLog(os.path.join(directory, "md5.bin"), MD5_RECORD_SIZE, readonly=True)
+    simhash_log = FingerprintLog(os.path.join(directory, "simhash.bin"), SIMHASH_RECORD_SIZE, readonly=True)
+    md5_index = DigestIndex(max(1 << 16, 2 * len(md5_log)))
+    with md5_log.loaded.cast("Q") as words:
+        for head, tail in zip(words[::2], words[1::2]):
+            md5_index.add(head, tail)
+    simhash_index = SimhashIndex(max_distance)
+    with simhash_log.loaded.cast("Q") as simhashes:
+        for simhash in simhashes:
+            simhash_index.add(simhash)
+    md5_log.close()
+    simhash_log.close()
+    return md5_index, simhash_index
+
+
+def open_tables(directory, max_distance):
+    md5_log = FingerprintLog(os.path.join(directory, "md5.bin"), MD5_RECORD_SIZE)
+    simhash_log = FingerprintLog(os.path.join(directory, "simhash.bin"), SIMHASH_RECORD_SIZE)
+    md5_table = DigestTable(os.path.join(directory, "md5.table"))
+    md5_table.catch_up(md5_log.loaded)
+    simhash_table = SimhashTable(os.path.join(directory, "simhash.table"), max_distance)
+    simhash_table.catch_up(simhash_log.loaded)
+    md5_log.close()
+    simhash_log.close()
+    return md5_table, simhash_table
+
+
+def measure_open(open_indexes, directory, max_distance):
+    tracemalloc.start()
+    start = time.perf_counter()
+    indexes = open_indexes(directory, max_distance)
+    seconds = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return indexes, seconds, memory
+
+
+def measure_queries(md5_index, simhash_index, md5_queries, simhash_queries):
+    start = time.perf_counter()
+    found = [halves in md5_index for halves in md5_queries]
+    md5_us = (time.perf_counter() - start) / len(md5_queries) * 1e6
+    start = time.perf_counter()
+    found += [simhash in simhash_index for simhash in simhash_queries]
+    simhash_us = (time.perf_counter() - start) / len(simhash_queries) * 1e6
+    return found, md5_us, simhash_us
+
+
+def main(fingerprint_count, query_count, max_distance, seed):
+    rng = random.Random(seed)
+    digests = [rng.getrandbits(128).to_bytes(16, "big") for _ in range(fingerprint_count)]
+    simhashes = [rng.getrandbits(64) for _ in range(fingerprint_count)]
+    md5_queries = [digest_halves(digest) for digest in rng.sample(digests, query_count // 2)]
+    md5_queries += [digest_halves(rng.getrandbits(128).to_bytes(16, "big")) for _ in range(query_count // 2)]
+    simhash_queries = [simhash ^ (1 << rng.randrange(64)) if max_distance else simhash
+                       for simhash in rng.sample(simhashes, query_count // 2)]
+    simhash_queries += [rng.getrandbits(64) for _ in range(query_count // 2)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_logs(directory, digests, [simhash.to_bytes(8, sys.byteorder) for simhash in simhashes])
+        rebuilt, rebuild_seconds, rebuild_memory = measure_open(open_rebuilt, directory, max_distance)
+        # The first open builds the tables from the logs, once; a resume only reopens them.
+        start = time.perf_counter()
+        for table in open_tables(directory, max_distance):
+            table.close()
+        first_open_seconds = time.perf_counter() - start
+        tables, open_seconds, open_memory = measure_open(open_tables, directory, max_distance)
+        results = {
+            "rebuilt": (rebuild_seconds, rebuild_memory, *measure_queries(*rebuilt, md5_queries, simhash_queries)),
+            "tables": (open_seconds, open_memory, *measure_queries(*tables, md5_queries, simhash_queries)),
+        }
+        table_size = sum(os.path.getsize(os.path.join(directory, name)) for name in ("md5.table", "simhash.table"))
+        for table in tables:
+            table.close()
+
+    print(f"{fingerprint_count} md5 digests and simhashes logged, simhash distance {max_distance}")
+    print(f"{'indexes':<10}{'open s':>9}{'memory MiB':>12}{'md5 us':>9}{'simhash us':>12}")
+    for name, (seconds, memory, _, md5_us, simhash_us) in results.items():
+        print(f"{name:<10}{seconds:>9.3f}{memory / 2 ** 20:>12.1f}{md5_us:>9.1f}{simhash_us:>12.1f}")
+    print(f"tables built from the logs in {first_open_seconds:.1f} s, {table_size / 2 ** 20:.1f} MiB on disk")
+    mismatches = sum(a != b for a, b in zip(results["rebuilt"][2], results["tables"][2]))
+    print(f"lookup mismatches: {mismatches}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--fingerprints", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--distance", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(1 if main(args.fingerprints, args.queries, args.distance, args.seed) else 0)
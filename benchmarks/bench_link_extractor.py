@@ -0,0 +1,87 @@
+"""
+Link extraction throughput of each LINK_EXTRACTORS backend over a page
+corpus: links per second and memory allocated per page, with a check that
+every backend finds the same links. Each backend gets a fresh
+ParsedDocument per page, so the BeautifulSoup backend pays for its tree.
+
+The corpus is synthetic pages by default, or every file in --corpus-dir
+(for example pages saved from a recorded crawl).
+
+Run from the repository root:
+    python -m benchmarks.bench_link_extractor --pages 500
+"""
+import os
+import random
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from utils.link_extractor import LINK_EXTRACTORS, get_link_extractor
+from utils.parsed_document import ParsedDocument
+from utils.synthetic_web import SyntheticWeb
+
+
+def make_pages(count, seed):
+    web = SyntheticWeb(seed=seed)
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        url = f"https://{rng.choice(web.hosts)}/page/{rng.randrange(web.pages_per_host)}"
+        final_url, _, content, _ = web.respond(url)
+        pages.append((final_url, content))
+    return pages
+
+
+def load_pages(corpus_dir):
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        with open(os.path.join(corpus_dir, name), "rb") as page_file:
+            pages.append((f"https://www.ics.uci.edu/{name}", page_file.read()))
+    return pages
+
+
+def measure_speed(extractor, pages):
+    start = time.perf_counter()
+    links = [extractor.extract(url, ParsedDocument(url, content, extractor)) for url, content in pages]
+    return time.perf_counter() - start, links
+
+
+def measure_allocations(extractor, pages):
+    # Traced separately: tracemalloc slows allocation-heavy code down a lot.
+    peaks = []
+    tracemalloc.start()
+    for url, content in pages:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        extractor.extract(url, ParsedDocument(url, content, extractor))
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    tracemalloc.stop()
+    return sum(peaks) / len(peaks)
+
+
+def main(page_count, corpus_dir, seed):
+    pages = load_pages(corpus_dir) if corpus_dir else make_pages(page_count, seed)
+    results = {}
+    for name in LINK_EXTRACTORS:
+        extractor = get_link_extractor(name)
+        seconds, links = measure_speed(extractor, pages)
+        results[name] = (seconds, links, measure_allocations(extractor, pages))
+
+    reference = results["bs4"][1]
+    print(f"{len(pages)} pages, {sum(len(links) for links in reference)} links")
+    print(f"{'backend':<10}{'links/s':>12}{'ms/page':>9}{'KiB/page':>10}{'mismatches':>12}")
+    for name, (seconds, links, allocated) in results.items():
+        mismatches = sum(found != expected for found, expected in zip(links, reference))
+        print(
+            f"{name:<10}{sum(len(page_links) for page_links in links) / seconds:>12.0f}"
+            f"{seconds / len(pages) * 1000:>9.2f}{allocated / 1024:>10.1f}{mismatches:>12}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--corpus-dir", type=str, help="directory of html files to use instead")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.pages, args.corpus_dir, args.seed)
@@ -0,0 +1,115 @@
+"""
+Crawl statistics kept as in-memory aggregates (a set of every visited url,
+subdomain counts, the longest page and a WordCounter) against a PageStore
+with one SQLite row per page and the reports as queries.
+
+Pages are recorded the way the worker and scraper record them, then the
+four reports are taken from both; they must agree. Memory is what Python
+allocates while recording (SQLite's own page cache is bounded and not
+included).
+
+Run from the repository root (writes to ../data_storage, like the crawler):
+    python -m benchmarks.bench_page_store --pages 200000
+"""
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from collections import Counter
+from urllib.parse import urldefrag
+
+import scraper
+from crawler.data_storage import DataStorage
+from crawler.worker import update_subdomain
+
+
+def make_pages(page_count, subdomain_count, vocabulary_size, words_per_page, seed):
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(vocabulary_size)]
+    cumulative_weights = list(itertools.accumulate(1 / rank for rank in range(1, vocabulary_size + 1)))
+    # A handful of word frequency dicts shared by all pages keeps setup fast.
+    frequencies = [
+        dict(Counter(rng.choices(vocabulary, cum_weights=cumulative_weights, k=rng.randint(1, words_per_page))))
+        for _ in range(64)
+    ]
+    for i in range(page_count):
+        url = f"https://host{rng.randrange(subdomain_count)}.ics.uci.edu/page/{i}"
+        yield url, rng.choice(frequencies), rng.randrange(1000, 100000), rng.random()
+
+
+def record_in_memory(data_storage, url, words_freq, byte_size, latency):
+    # Worker.process_response and scraper.scraper without a page store.
+    data_storage.visited_url.add(urldefrag(url)[0])
+    update_subdomain(url, data_storage.subdomains)
+    scraper.update_longest_page(url, words_freq, data_storage.longest_page)
+    scraper.update_common_words(words_freq, data_storage.common_words)
+
+
+def record_in_page_store(data_storage, url, words_freq, byte_size, latency):
+    # Worker.record_page and scraper.scraper with one.
+    scraper.update_common_words(words_freq, data_storage.common_words)
+    data_storage.add_page(url, 200, byte_size, sum(words_freq.values()), bytes(16), 0, 1, latency)
+
+
+def run(data_storage, record, pages):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for page in pages:
+        record(data_storage, *page)
+    record_seconds = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    snapshot = data_storage.snapshot()
+    report_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    data_storage.snapshot()
+    repeat_seconds = time.perf_counter() - start
+    return snapshot, record_seconds, memory, report_seconds * 1000, repeat_seconds * 1000
+
+
+def main(page_count, subdomain_count, vocabulary_size, words_per_page, seed):
+    with tempfile.TemporaryDirectory() as directory:
+        engines = {
+            "memory": DataStorage(),
+            "sqlite": DataStorage(page_store_file=os.path.join(directory, "pages.sqlite")),
+        }
+        recorders = {"memory": record_in_memory, "sqlite": record_in_page_store}
+        results = {}
+        for name, data_storage in engines.items():
+            pages = make_pages(page_count, subdomain_count, vocabulary_size, words_per_page, seed)
+            results[name] = run(data_storage, recorders[name], pages)
+            data_storage.close()
+        file_size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    (memory_snapshot, *_), (sqlite_snapshot, *_) = results.values()
+    mismatches = [key for key in ("unique_pages_count", "subdomains") if memory_snapshot[key] != sqlite_snapshot[key]]
+    if memory_snapshot["longest_page"]["word_count"] != sqlite_snapshot["longest_page"]["word_count"]:
+        mismatches.append("longest_page")
+    # Ties at the 50th place may be broken differently, so compare counts.
+    if sorted(memory_snapshot["top50_common_words"].values()) != sorted(sqlite_snapshot["top50_common_words"].values()):
+        mismatches.append("top50_common_words")
+
+    print(f"{page_count} pages on {subdomain_count} subdomains, {vocabulary_size} word vocabulary")
+    print(f"{'engine':<10}{'pages/s':>10}{'memory MiB':>12}{'reports ms':>12}{'again ms':>10}")
+    for name, (_, record_seconds, memory, report_ms, repeat_ms) in results.items():
+        print(f"{name:<10}{page_count / record_seconds:>10.0f}{memory / 2 ** 20:>12.1f}"
+              f"{report_ms:>12.1f}{repeat_ms:>10.1f}")
+    print(f"page store file: {file_size / 2 ** 20:.1f} MiB")
+    print(f"report mismatches: {', '.join(mismatches) or 'none'}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200000)
+    parser.add_argument("--subdomains", type=int, default=1000)
+    parser.add_argument("--vocabulary", type=int, default=100000)
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(1 if main(args.pages, args.subdomains, args.vocabulary, args.words_per_page, args.seed) else 0)
@@ -0,0 +1,77 @@
+"""
+Per-page parsing cost of the response pipeline: every stage decoding and
+parsing the raw content on its own (as the worker and scraper used to)
+against one shared ParsedDocument.
+
+Run from the repository root:
+    python -m benchmarks.bench_parse --pages 300
+"""
+import random
+import re
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from urllib.parse import urljoin, urldefrag
+
+from bs4 import BeautifulSoup
+
+from utils.parsed_document import ParsedDocument
+from utils.synthetic_web import SyntheticWeb
+from utils.text_processor import filter_text, tokenize, compute_word_frequencies
+from crawler.worker import DATE_REGEX
+
+
+def parse_per_stage(url, content):
+    # Simhash (of the raw html's words), date check, page content and links,
+    # each from the raw bytes.
+    Counter(re.findall(r'\w+', content.decode('utf-8', errors='ignore')))
+    dates = DATE_REGEX.findall(url + content.decode('utf-8', errors='ignore'))
+    soup = BeautifulSoup(content, "lxml")
+    words_freq = compute_word_frequencies(tokenize(filter_text(soup.text)))
+    soup = BeautifulSoup(content, "lxml")
+    links = [urldefrag(urljoin(url, a["href"]))[0] for a in soup.find_all("a", href=True)]
+    return dates, words_freq, links
+
+
+def parse_shared(url, content):
+    # The simhash is now taken over word_frequencies, which are counted anyway.
+    document = ParsedDocument(url, content)
+    dates = DATE_REGEX.findall(url + document.html)
+    return dates, document.word_frequencies, document.links
+
+
+def make_pages(count, seed):
+    web = SyntheticWeb(seed=seed)
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        url = f"https://{rng.choice(web.hosts)}/page/{rng.randrange(web.pages_per_host)}"
+        final_url, _, content, _ = web.respond(url)
+        pages.append((final_url, content))
+    return pages
+
+
+def measure(parse, pages):
+    start = time.perf_counter()
+    results = [parse(url, content) for url, content in pages]
+    return (time.perf_counter() - start) / len(pages) * 1000, results
+
+
+def main(page_count, seed):
+    pages = make_pages(page_count, seed)
+    per_stage_ms, per_stage = measure(parse_per_stage, pages)
+    shared_ms, shared = measure(parse_shared, pages)
+    assert per_stage == shared, "ParsedDocument results differ from per-stage parsing"
+    print(f"{page_count} pages, {sum(len(content) for _, content in pages) / len(pages) / 1024:.1f} KiB on average")
+    print(f"{'pipeline':<12}{'ms/page':>9}")
+    print(f"{'per stage':<12}{per_stage_ms:>9.2f}")
+    print(f"{'shared':<12}{shared_ms:>9.2f}")
+    print(f"speedup {per_stage_ms / shared_ms:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.pages, args.seed)
@@ -0,0 +1,94 @@
+"""
+Memory and lookup latency of the frontier's seen-url check: the in-memory
+SeenIndex (with and without its Bloom filter) against the shelve lookup
+plus url -> depth dict the frontier used before.
+
+Run from the repository root:
+    python -m benchmarks.bench_seen_index --urls 200000
+"""
+import os
+import random
+import shelve
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from utils import get_urlhash
+from crawler.seen_index import SeenIndex, url_fingerprint
+
+
+def make_urls(count, seed):
+    rng = random.Random(seed)
+    return [
+        f"https://host{rng.randrange(50)}.ics.uci.edu/page/{i}?id={rng.randrange(10 ** 9)}"
+        for i in range(count)
+    ]
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    structure = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return structure, current
+
+
+def measure_lookups(contains, keys):
+    start = time.perf_counter()
+    for key in keys:
+        contains(key)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+def bench_shelve(urls, hits, misses):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        save = shelve.open(os.path.join(tmp_dir, "bench.shelve"))
+        for url in urls:
+            save[get_urlhash(url)] = (url, False)
+        save.sync()
+        # The old url_depth dict kept its own copy of every url string alive.
+        depths, memory = measure_memory(lambda: {(url + " ")[:-1]: 0 for url in urls})
+        hit_us = measure_lookups(lambda urlhash: urlhash in save, [get_urlhash(url) for url in hits])
+        miss_us = measure_lookups(lambda urlhash: urlhash in save, [get_urlhash(url) for url in misses])
+        save.close()
+    return memory, hit_us, miss_us
+
+
+def bench_seen_index(urls, hits, misses, bloom_capacity):
+    def build():
+        index = SeenIndex(bloom_capacity=bloom_capacity)
+        for url in urls:
+            index.add(url_fingerprint(get_urlhash(url)))
+        return index
+
+    index, memory = measure_memory(build)
+    hit_us = measure_lookups(index.__contains__, [url_fingerprint(get_urlhash(url)) for url in hits])
+    miss_us = measure_lookups(index.__contains__, [url_fingerprint(get_urlhash(url)) for url in misses])
+    return memory, hit_us, miss_us
+
+
+def main(url_count, lookup_count, seed):
+    urls = make_urls(url_count, seed)
+    rng = random.Random(seed)
+    hits = rng.sample(urls, min(lookup_count, url_count))
+    misses = [url + "&miss" for url in rng.sample(urls, min(lookup_count, url_count))]
+
+    results = {
+        "shelve + url_depth dict": bench_shelve(urls, hits, misses),
+        "SeenIndex": bench_seen_index(urls, hits, misses, 0),
+        "SeenIndex + Bloom filter": bench_seen_index(urls, hits, misses, url_count),
+    }
+    print(f"{url_count} urls, {len(hits)} hit and {len(misses)} miss lookups")
+    print(f"{'structure':<26}{'memory MiB':>12}{'B/url':>8}{'hit us':>9}{'miss us':>9}")
+    for name, (memory, hit_us, miss_us) in results.items():
+        print(f"{name:<26}{memory / 2 ** 20:>12.1f}{memory / url_count:>8.1f}{hit_us:>9.2f}{miss_us:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.urls, args.lookups, args.seed)
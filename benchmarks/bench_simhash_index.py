@@ -0,0 +1,95 @@
+"""
+Near-duplicate lookups on 64-bit simhash fingerprints: the block-partitioned
+SimhashIndex against the exact-match set DataStorage used before, which
+misses every near duplicate.
+
+Queries are stored fingerprints with 1..k random bits flipped (near
+duplicates, which must all be found) and fresh random fingerprints (which a
+brute-force scan over a sample confirms are not near anything).
+
+Run from the repository root:
+    python -m benchmarks.bench_simhash_index --fingerprints 10000000
+"""
+import random
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from crawler.simhash_index import SimhashIndex, popcount
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    structure = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return structure, current
+
+
+def flip_bits(fingerprint, count, rng):
+    for bit in rng.sample(range(64), count):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def measure_queries(find, queries):
+    start = time.perf_counter()
+    found = [find(query) for query in queries]
+    return found, (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main(fingerprint_count, query_count, max_distance, bucket_bits, seed):
+    rng = random.Random(seed)
+    fingerprints = [rng.getrandbits(64) for _ in range(fingerprint_count)]
+
+    start = time.perf_counter()
+    index, index_memory = measure_memory(lambda: build_index(fingerprints, max_distance, bucket_bits))
+    build_seconds = time.perf_counter() - start
+    exact, set_memory = measure_memory(lambda: {(fingerprint + 1) - 1 for fingerprint in fingerprints})
+
+    near = [flip_bits(fingerprint, rng.randint(1, max_distance), rng)
+            for fingerprint in rng.sample(fingerprints, query_count)] if max_distance else []
+    fresh = [rng.getrandbits(64) for _ in range(query_count)]
+
+    near_found, near_us = measure_queries(index.find, near) if near else ([], 0.0)
+    fresh_found, fresh_us = measure_queries(index.find, fresh)
+    exact_near = sum(query in exact for query in near)
+
+    # Brute force over a sample, so a false negative on fresh queries shows up too.
+    mismatches = sum(found is None for found in near_found)
+    sample = fingerprints[:200000]
+    for query, found in zip(fresh[:20], fresh_found[:20]):
+        expected = any(popcount(query ^ fingerprint) <= max_distance for fingerprint in sample)
+        if expected and found is None:
+            mismatches += 1
+    mismatches += sum(found is not None and popcount(found ^ query) > max_distance
+                      for query, found in zip(fresh, fresh_found))
+
+    print(f"{fingerprint_count} fingerprints, k={max_distance}, {bucket_bits}-bit buckets, "
+          f"built in {build_seconds:.1f} s")
+    print(f"{'structure':<22}{'memory MiB':>12}{'B/fp':>8}{'near us':>10}{'fresh us':>10}{'near found':>12}")
+    print(f"{'set (exact match)':<22}{set_memory / 2 ** 20:>12.1f}{set_memory / fingerprint_count:>8.1f}"
+          f"{'':>10}{'':>10}{exact_near:>6}/{len(near):<5}")
+    print(f"{'SimhashIndex':<22}{index_memory / 2 ** 20:>12.1f}{index_memory / fingerprint_count:>8.1f}"
+          f"{near_us:>10.1f}{fresh_us:>10.1f}{len(near) - sum(f is None for f in near_found):>6}/{len(near):<5}")
+    print(f"mismatches: {mismatches}")
+    return mismatches
+
+
+def build_index(fingerprints, max_distance, bucket_bits):
+    index = SimhashIndex(max_distance, bucket_bits)
+    for fingerprint in fingerprints:
+        index.add(fingerprint)
+    return index
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--fingerprints", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--distance", type=int, default=3)
+    parser.add_argument("--bucket-bits", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(1 if main(args.fingerprints, args.queries, args.distance, args.bucket_bits, args.seed) else 0)
@@ -0,0 +1,76 @@
+"""
+Cold import time of the crawler's entry modules, each measured in fresh
+interpreters, plus the slowest imports (from python -X importtime) and
+any heavy optional dependency that got imported eagerly.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup --runs 5 --max-ms 1000
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["scraper", "crawler", "launch"]
+# Imported on first use only; none of these should load at startup.
+LAZY_MODULES = ["nltk", "bs4", "simhash", "numpy", "spacetime"]
+PROBE = (
+    "import sys, time; start = time.perf_counter(); import {module}; "
+    "print(json.dumps([time.perf_counter() - start, [m for m in {lazy} if m in sys.modules]]))"
+)
+
+
+def import_once(module):
+    code = "import json; " + PROBE.format(module=module, lazy=LAZY_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+    seconds, eager = json.loads(output.strip().splitlines()[-1])
+    return seconds, eager
+
+
+def slowest_imports(module, count):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line.split(":", 1)[1].split("|")]
+        imports.append((int(cumulative_us), int(self_us), name))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main(runs, top, max_ms):
+    slow = []
+    print(f"{'module':<10}{'median ms':>11}{'min ms':>9}  eagerly imported")
+    for module in MODULES:
+        timings = []
+        for _ in range(runs):
+            seconds, eager = import_once(module)
+            timings.append(seconds * 1000)
+        median_ms = statistics.median(timings)
+        print(f"{module:<10}{median_ms:>11.1f}{min(timings):>9.1f}  {', '.join(eager) or '-'}")
+        if max_ms is not None and median_ms > max_ms:
+            slow.append(module)
+
+    print("\nslowest imports under launch (cumulative ms, self ms):")
+    for cumulative_us, self_us, name in slowest_imports("launch", top):
+        print(f"{cumulative_us / 1000:>9.1f}{self_us / 1000:>9.1f}  {name}")
+
+    if slow:
+        print(f"\nOver {max_ms} ms: {', '.join(slow)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest imports to list")
+    parser.add_argument("--max-ms", type=float, help="exit with 1 if a module's median import is slower")
+    args = parser.parse_args()
+    main(args.runs, args.top, args.max_ms)
@@ -0,0 +1,95 @@
+"""
+Throughput and output parity of the fused count_words tokenizer against the
+filter_text -> tokenize -> compute_word_frequencies pipeline it replaces.
+
+The corpus is the visible text of synthetic pages plus a set of edge cases
+(urls, e-mail addresses, contractions, digits, non-ASCII letters and
+whitespace), or the text of every html file in --corpus-dir. Any page whose
+frequencies differ is printed and the run exits with 1.
+
+Run from the repository root:
+    python -m benchmarks.bench_tokenizer --pages 300
+"""
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+from bs4 import BeautifulSoup
+
+from utils.synthetic_web import SyntheticWeb
+from utils.text_processor import count_words, filter_text, tokenize, compute_word_frequencies
+
+
+EDGE_CASES = [
+    "See https://www.ics.uci.edu/~x/a.html?b=1 or http://cs.uci.edu, mail me@ics.uci.edu today.",
+    "We cannot go; gonna, Gotta, LEMME, gimme and wanna are split, wannabe and cannotx are not.",
+    "Don't won't it's I'm e-mail state-of-the-art foo.bar 3rd 2023-11-03 CS121 x y z",
+    "Café naïve résumé über Straße été 中文 слово",
+    "non breaking em space\ttab\nnew\x1cline separator",
+    "a an the THE The us US na NA supercalifragilisticexpialidocious abcdefghijklmno abcdefghijklmnop",
+    "https://only.a/url",
+    "",
+]
+
+
+def make_texts(count, seed):
+    web = SyntheticWeb(seed=seed)
+    rng = random.Random(seed)
+    texts = list(EDGE_CASES)
+    for _ in range(count):
+        url = f"https://{rng.choice(web.hosts)}/page/{rng.randrange(web.pages_per_host)}"
+        _, _, content, _ = web.respond(url)
+        texts.append(BeautifulSoup(content, "lxml").text)
+    return texts
+
+
+def load_texts(corpus_dir):
+    texts = list(EDGE_CASES)
+    for name in sorted(os.listdir(corpus_dir)):
+        with open(os.path.join(corpus_dir, name), "rb") as page_file:
+            texts.append(BeautifulSoup(page_file.read(), "lxml").text)
+    return texts
+
+
+def pipeline(text):
+    return compute_word_frequencies(tokenize(filter_text(text)))
+
+
+def measure(count, texts):
+    start = time.perf_counter()
+    results = [count(text) for text in texts]
+    return time.perf_counter() - start, results
+
+
+def main(page_count, corpus_dir, seed):
+    texts = load_texts(corpus_dir) if corpus_dir else make_texts(page_count, seed)
+    characters = sum(len(text) for text in texts)
+    pipeline_seconds, expected = measure(pipeline, texts)
+    fused_seconds, found = measure(count_words, texts)
+
+    mismatches = 0
+    for text, before, after in zip(texts, expected, found):
+        if before != after:
+            mismatches += 1
+            missing = {word: count for word, count in before.items() if after.get(word) != count}
+            extra = {word: count for word, count in after.items() if before.get(word) != count}
+            print(f"MISMATCH in {text[:60]!r}: pipeline {missing}, count_words {extra}")
+
+    print(f"{len(texts)} texts, {characters / 2 ** 20:.1f} MiB of text")
+    print(f"{'tokenizer':<14}{'Mchars/s':>10}{'ms/text':>9}")
+    print(f"{'pipeline':<14}{characters / pipeline_seconds / 1e6:>10.2f}{pipeline_seconds / len(texts) * 1000:>9.2f}")
+    print(f"{'count_words':<14}{characters / fused_seconds / 1e6:>10.2f}{fused_seconds / len(texts) * 1000:>9.2f}")
+    print(f"speedup {pipeline_seconds / fused_seconds:.1f}x, {mismatches} mismatching texts")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--corpus-dir", type=str, help="directory of html files to use instead")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.pages, args.corpus_dir, args.seed)
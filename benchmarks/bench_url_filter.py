@@ -0,0 +1,122 @@
+"""
+URLs/sec of the compiled UrlFilter against the regex-based is_valid it
+replaced (kept below as legacy_is_valid), with a parity check: every url
+must get the same verdict from both. Urls the legacy rules raised on (an
+exception dropped every link of the page) count as rejected.
+
+Run from the repository root:
+    python -m benchmarks.bench_url_filter --urls 200000
+"""
+import random
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from urllib.parse import urlparse, urlsplit
+
+from scraper import canonicalize_url
+from utils.url_filter import UrlFilter, BLOCKED_EXTENSIONS, MAX_URL_LENGTH
+
+
+HOSTS = [
+    "www.ics.uci.edu", "vision.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu", "www.stat.uci.edu",
+    "WWW.ICS.UCI.EDU", "ics.uci.edu", "www.uci.edu", "today.uci.edu", "www.ics.uci.edu.example.com",
+    "physics.uci.edu", "www.example.com", "www.ics.uci.edu:8080", "user@www.ics.uci.edu", "[::1", "",
+]
+SCHEMES = ["http", "https", "HTTPS", "ftp", "mailto", "javascript"]
+EXTENSIONS = sorted(BLOCKED_EXTENSIONS) + ["html", "htm", "PDF", "Txt", "", "php5", "tar.gz", "pdf/"]
+
+
+def legacy_is_valid(url):
+    canonicalized_url = canonicalize_url(url)
+    parsed = urlparse(canonicalized_url)
+    if parsed.hostname is None:
+        return False
+    if parsed.scheme not in {"http", "https"}:
+        return False
+    if len(url) > MAX_URL_LENGTH:
+        return False
+    if not re.match(
+            r"(.*\.ics\.uci\.edu.*)|"
+            r"(.*\.cs\.uci\.edu.*)|"
+            r"(.*\.informatics\.uci\.edu.*)|"
+            r"(.*\.stat\.uci\.edu.*)|"
+            r"(today\.uci\.edu/department/information_computer_sciences.*)",
+            parsed.hostname,
+    ):
+        return False
+    if re.match(
+            r".*\.(css|js|bmp|gif|jpe?g|ico|swp"
+            + r"|png|tiff?|mlid|mp2|mp3|mp4|tmp"
+            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf|bak"
+            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names|php"
+            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|asm|toml"
+            + r"|epub|dll|cnf|tgz|sha1|exe|app|xml|json|jsx|h|hpp|yaml"
+            + r"|thmx|mso|arff|rtf|jar|csv|py|java|jar|scss|c|war|ini"
+            + r"|flv|mpg|3gp|flac|aac|svg|webp|odt|ods|odp|odg|sqlite"
+            + r"|zpix|tar.gz|rar|7z|xz|sh|bat|dll|so|ttf|woff|eot|otf"
+            + r"|rm|smil|wmv|swf|wma|zip|rar|gz|txt|img|sql|pdf|cpp)$",
+            parsed.path.lower(),
+    ):
+        return False
+    return True
+
+
+def legacy_verdict(url):
+    try:
+        return legacy_is_valid(url)
+    except ValueError:
+        return False
+
+
+def make_urls(count, seed):
+    rng = random.Random(seed)
+    urls = []
+    for i in range(count):
+        path = "/".join(f"p{rng.randrange(100)}" for _ in range(rng.randint(0, 4)))
+        extension = rng.choice(EXTENSIONS) if rng.random() < 0.5 else "html"
+        url = f"{rng.choice(SCHEMES)}://{rng.choice(HOSTS)}/{path}/{i}.{extension}"
+        if rng.random() < 0.1:
+            url += f";jsessionid={rng.randrange(10 ** 6)}"
+        if rng.random() < 0.3:
+            url += f"?b={rng.randrange(100)}&a={rng.randrange(100)}"
+        if rng.random() < 0.1:
+            url += f"#s{rng.randrange(10)}"
+        if rng.random() < 0.05:
+            url += "/x" * rng.randrange(100)
+        urls.append(url)
+    return urls
+
+
+def main(url_count, seed):
+    urls = make_urls(url_count, seed)
+    # urlsplit caches its results; neither run may profit from the other.
+    urlsplit.cache_clear()
+    start = time.perf_counter()
+    expected = [legacy_verdict(url) for url in urls]
+    legacy_seconds = time.perf_counter() - start
+
+    url_filter = UrlFilter()
+    urlsplit.cache_clear()
+    start = time.perf_counter()
+    accepted = set(url_filter.filter_urls(urls))
+    compiled_seconds = time.perf_counter() - start
+
+    mismatches = [url for url, verdict in zip(urls, expected) if (url in accepted) != verdict]
+    for url in mismatches[:20]:
+        print(f"MISMATCH {url}: legacy {url not in accepted}, UrlFilter {url in accepted}")
+    print(f"{url_count} urls, {sum(expected)} accepted")
+    print(f"{'filter':<12}{'urls/s':>12}")
+    print(f"{'legacy':<12}{url_count / legacy_seconds:>12.0f}")
+    print(f"{'UrlFilter':<12}{url_count / compiled_seconds:>12.0f}")
+    print(f"speedup {legacy_seconds / compiled_seconds:.1f}x, {len(mismatches)} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.urls, args.seed)
@@ -0,0 +1,128 @@
+"""
+Crawl-wide word counting: the old single dict updated under one lock and
+fully sorted for every top-50 report, against WordCounter's per-thread
+shards with an incremental top 50, exact and in a count-min sketch.
+
+Pages are Zipf-distributed samples from a large vocabulary, counted by
+several threads at once. The exact top 50 must match the old one; for the
+sketch the overlap with it and the largest overcount are reported.
+
+Run from the repository root:
+    python -m benchmarks.bench_word_counts --pages 20000 --threads 4
+"""
+import itertools
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from collections import Counter
+
+from crawler.word_counter import WordCounter
+
+
+class LegacyCounter(object):
+    """DataStorage.common_words before: one dict, one lock, a full sort per report."""
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.RLock()
+
+
+    def add(self, frequencies):
+        with self.lock:
+            for word, count in frequencies.items():
+                self.counts[word] = self.counts.get(word, 0) + count
+
+
+    def top(self, n):
+        with self.lock:
+            return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+def make_pages(page_count, vocabulary_size, words_per_page, seed):
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(vocabulary_size)]
+    cumulative_weights = list(itertools.accumulate(1 / rank for rank in range(1, vocabulary_size + 1)))
+    return [
+        dict(Counter(rng.choices(vocabulary, cum_weights=cumulative_weights, k=words_per_page)))
+        for _ in range(page_count)
+    ]
+
+
+def run(make_counter, pages, thread_count, reports):
+    """Count `pages` on `thread_count` threads, asking for the top 50 `reports` times along the way."""
+    counter = make_counter()
+    chunks = [pages[i::thread_count] for i in range(thread_count)]
+    report_seconds = []
+
+    def count(chunk):
+        for page in chunk:
+            counter.add(page)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=count, args=(chunk,)) for chunk in chunks]
+    for thread in threads:
+        thread.start()
+    for _ in range(reports):
+        report_start = time.perf_counter()
+        counter.top(50)
+        report_seconds.append(time.perf_counter() - report_start)
+    for thread in threads:
+        thread.join()
+    report_start = time.perf_counter()
+    top = counter.top(50)
+    report_seconds.append(time.perf_counter() - report_start)
+    elapsed = time.perf_counter() - start
+    return top, len(pages) / elapsed, max(report_seconds) * 1000, measure_memory(make_counter, pages)
+
+
+def measure_memory(make_counter, pages):
+    # A separate single-threaded pass, as tracing allocations slows counting down.
+    tracemalloc.start()
+    counter = make_counter()
+    for page in pages:
+        counter.add(page)
+    counter.top(50)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return memory
+
+
+def main(page_count, vocabulary_size, words_per_page, thread_count, sketch_width, reports, seed):
+    pages = make_pages(page_count, vocabulary_size, words_per_page, seed)
+    results = {
+        "dict + lock + sort": run(LegacyCounter, pages, thread_count, reports),
+        "WordCounter exact": run(WordCounter, pages, thread_count, reports),
+        f"WordCounter sketch {sketch_width}": run(
+            lambda: WordCounter(sketch_width=sketch_width), pages, thread_count, reports),
+    }
+    (legacy_top, *_), (exact_top, *_), (sketch_top, *_) = results.values()
+    legacy_counts = dict(legacy_top)
+    # Ties at the 50th place may be broken differently, so compare counts.
+    mismatches = sum(a != b for a, b in zip(sorted(count for _, count in legacy_top),
+                                           sorted(count for _, count in exact_top)))
+    overlap = len(set(legacy_counts) & {word for word, _ in sketch_top})
+    overcount = max((count - legacy_counts[word] for word, count in sketch_top if word in legacy_counts), default=0)
+
+    print(f"{page_count} pages of {words_per_page} words from {vocabulary_size} on {thread_count} threads")
+    print(f"{'counter':<30}{'pages/s':>10}{'worst top-50 ms':>17}{'memory MiB':>12}")
+    for name, (_, pages_per_sec, report_ms, memory) in results.items():
+        print(f"{name:<30}{pages_per_sec:>10.0f}{report_ms:>17.2f}{memory / 2 ** 20:>12.1f}")
+    print(f"exact top 50 mismatches: {mismatches}")
+    print(f"sketch top 50: {overlap}/50 words in the exact top 50, largest overcount {overcount}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20000)
+    parser.add_argument("--vocabulary", type=int, default=500000)
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--sketch-width", type=int, default=1 << 16)
+    parser.add_argument("--reports", type=int, default=5, help="top-50 reports taken while counting")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(1 if main(args.pages, args.vocabulary, args.words_per_page, args.threads,
+                       args.sketch_width, args.reports, args.seed) else 0)
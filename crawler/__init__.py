@@ -1,13 +1,20 @@
-import asyncio
 import signal
 import threading
+import time
 
 from utils import get_logger
+from utils.download import close_response_cache
+from utils.parse_pool import close_parse_pool
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.async_engine import AsyncEngine
+from crawler.response_filters import FilterChain
 from crawler.data_storage import DataStorage
 
 
+WORKER_POLL_INTERVAL = 0.2
+
+
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker,
                  data_storage_class=DataStorage):
@@ -16,18 +23,29 @@ class Crawler(object):
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
         self.worker_factory = worker_factory
-        self.next_permission_request_time = {}
-        self.data_storage = data_storage_class()
+        self.data_storage = data_storage_class(
+            config.simhash_distance, config.fingerprint_dir, restart, config.word_sketch_width,
+            config.page_store_file if config.page_store == "sqlite" else None,
+            config.commit_batch_size, config.durability_window)
         self.store_data_timer = None
+        # Guards store_data_timer against a store rescheduling itself while
+        # the crawler shuts down.
+        self.store_data_lock = threading.Lock()
+        self.store_data_stopped = False
         self.stop_flag = threading.Event()
 
 
     def start_async(self):
-        self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier, self.data_storage,
-                                self.next_permission_request_time, self.stop_flag)
-            for worker_id in range(self.config.threads_count)
-        ]
+        if self.config.engine == "asyncio":
+            # A single thread running the event loop stands in for the workers.
+            self.workers = [
+                AsyncEngine(self.config, self.frontier, self.data_storage, self.stop_flag, self.worker_factory)
+            ]
+        else:
+            self.workers = [
+                self.worker_factory(worker_id, self.config, self.frontier, self.data_storage, self.stop_flag)
+                for worker_id in range(self.config.threads_count)
+            ]
         for worker in self.workers:
             worker.start()
         self.store_data_periodically()
@@ -41,26 +59,97 @@ class Crawler(object):
 
 
     def store_data_periodically(self):
+        # Only snapshots are taken here; the files are written on the data
+        # storage's writer thread. The human readable summary is written
+        # once, at shutdown.
         self.logger.info("Storing data...")
         self.data_storage.store_scraped_data()
-        self.data_storage.finalize_data()
-        self.store_data_timer = threading.Timer(300, self.store_data_periodically)
-        self.store_data_timer.start()
+        self.store_filter_stats()
+        self.store_fingerprints()
+        with self.store_data_lock:
+            if not self.store_data_stopped:
+                self.store_data_timer = threading.Timer(300, self.store_data_periodically)
+                self.store_data_timer.start()
+
+
+    def stop_storing_data(self):
+        """Stop the periodic store, waiting for one that is already running."""
+        # Timer.cancel() does not stop a store in progress, which would
+        # otherwise write to the frontier and fingerprint logs as they close.
+        with self.store_data_lock:
+            self.store_data_stopped = True
+            timer = self.store_data_timer
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+            timer.join()
 
 
     def join(self):
         try:
-            for worker in self.workers:
-                worker.join()
+            self.wait_for_workers()
         except KeyboardInterrupt:
             self.logger.info("Received a stop signal and is stopping all working threads...")
             self.stop()
+            self.join_stopped_workers()
         finally:
+            self.stop_storing_data()
+            # Pages the workers left in the parse pool are scraped into the
+            # stores before their final data is taken.
+            close_parse_pool()
             self.logger.info("Storing final data...")
             self.data_storage.store_scraped_data()
             self.data_storage.finalize_data()
-            if self.store_data_timer:
-                self.store_data_timer.cancel()
+            self.store_filter_stats()
+            self.frontier.close()
+            self.data_storage.close()
+            close_response_cache()
+
+
+    def wait_for_workers(self, timeout=None):
+        """Wait until every worker has stopped, or for `timeout` seconds; return whether they all did."""
+        # Polls rather than blocking in Thread.join(): on Python 3.11, a
+        # KeyboardInterrupt raised inside join() marks the thread as
+        # stopped while it still runs.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while any(worker.is_alive() for worker in self.workers):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(WORKER_POLL_INTERVAL)
+        return True
+
+
+    def join_stopped_workers(self):
+        """Wait for stopped workers to finish the page in hand, for at most one fetch's timeout."""
+        # A worker only sees the stop flag between pages, and must not find
+        # the stores closed under it; a second stop signal ends the wait.
+        try:
+            stopped = self.wait_for_workers(self.config.connect_timeout + self.config.read_timeout)
+        except KeyboardInterrupt:
+            stopped = False
+        if not stopped:
+            running = sum(worker.is_alive() for worker in self.workers)
+            self.logger.warning(f"{running} working threads did not stop in time, closing the stores anyway.")
+
+
+    def filter_stats(self):
+        """Calls, rejections and seconds per response filter, over all workers."""
+        return FilterChain.merge(worker.filter_chain.export() for worker in self.workers)
+
+
+    def store_filter_stats(self):
+        stats = self.filter_stats()
+        self.data_storage.store_json("filter_stats.json", stats)
+        self.logger.info("Response filters: " + ", ".join(
+            f"{name} rejected {stage['rejected']}/{stage['calls']} in {stage['seconds']:.2f}s"
+            for name, stage in stats.items()))
+
+
+    def store_fingerprints(self):
+        # A page's fingerprints must not reach disk before its completion and
+        # links do, or a resumed crawl would skip it as a duplicate of itself
+        # without ever queueing its links.
+        self.frontier.commit()
+        self.data_storage.flush_fingerprints()
 
 
     def stop(self):
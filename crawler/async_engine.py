@@ -0,0 +1,144 @@
+import asyncio
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from utils import get_logger
+from utils.async_download import AsyncCacheClient
+from utils.download import build_response, aborted_response, DownloadAborted, cached_response, store_response
+from crawler.worker import Worker, FRONTIER_POLL_TIMEOUT, MAX_FILE_SIZE
+
+
+class AsyncEngine(Thread):
+    """
+    Crawls on a single asyncio event loop instead of one thread per fetch.
+
+    Up to MAX_IN_FLIGHT downloads run concurrently on the loop. Per-host
+    politeness stays in the Frontier: the engine only awaits a timer until
+    the earliest host is ready. Decoding responses, deduplication and
+    scraping are CPU-bound, so they run on an executor through the same
+    Worker.process_response the threaded engine uses, which with a parse
+    pool only checks the headers and submits the page.
+
+    Frontier calls take its lock, which executor threads hold while adding
+    urls, so they run on a thread of their own rather than on the loop,
+    where waiting for the lock would stall every download in flight.
+    """
+    def __init__(self, config, frontier, data_storage, stop_flag, worker_factory=Worker):
+        self.logger = get_logger("ASYNC-ENGINE", "Worker")
+        self.config = config
+        self.frontier = frontier
+        self._stop_flag = stop_flag
+        # Never started as a thread; only its response handling is used.
+        self.handler = worker_factory("async", config, frontier, data_storage, stop_flag)
+        self.handler.on_pooled_page_done = self._wake_up
+        self.filter_chain = self.handler.filter_chain
+        self.loop = None
+        self.wakeup = None
+        self.frontier_executor = None
+        super().__init__(daemon=True)
+
+
+    def run(self):
+        asyncio.run(self.crawl())
+
+
+    def stop(self):
+        self._stop_flag.set()
+        self._wake_up()
+
+
+    def _wake_up(self):
+        # Called from other threads, e.g. after the parse pool's consumer
+        # added a page's links to the frontier.
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self.wakeup.set)
+            except RuntimeError:
+                # The loop closed in the meantime; the crawl is over anyway.
+                pass
+
+
+    async def crawl(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        client = AsyncCacheClient(self.config)
+        executor = ThreadPoolExecutor(self.config.threads_count)
+        self.frontier_executor = ThreadPoolExecutor(1)
+        slots = asyncio.Semaphore(self.config.max_in_flight)
+        tasks = set()
+        try:
+            while not self._stop_flag.is_set():
+                await slots.acquire()
+                tbd_url = await self._call_frontier(self.frontier.get_tbd_url, 0)
+                if tbd_url is None:
+                    slots.release()
+                    if not tasks and await self._call_frontier(self.handler.is_crawl_done):
+                        self.logger.info("Frontier is empty. Stopping Crawler.")
+                        break
+                    await self._wait_for_ready_host()
+                    continue
+                task = asyncio.create_task(self._crawl_url(tbd_url, client, executor, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            await client.close()
+            executor.shutdown(wait=True)
+            self.frontier_executor.shutdown(wait=True)
+
+
+    def _call_frontier(self, method, *args):
+        return self.loop.run_in_executor(self.frontier_executor, method, *args)
+
+
+    async def _wait_for_ready_host(self):
+        # Wake up when the earliest host is ready or a fetch or a pooled page
+        # finishes (which can reschedule its host or add new urls),
+        # whichever comes first.
+        timeout = await self._call_frontier(self.frontier.next_ready_in)
+        if timeout is None:
+            timeout = FRONTIER_POLL_TIMEOUT
+        self.wakeup.clear()
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+    async def _crawl_url(self, tbd_url, client, executor, slots):
+        try:
+            # Marks rejected urls complete in the frontier.
+            if not await self._call_frontier(self.handler.check_url_before_download, tbd_url):
+                return
+            start = time.perf_counter()
+            resp = await self.loop.run_in_executor(executor, cached_response, tbd_url, self.config, self.logger)
+            latency = time.perf_counter() - start
+            if resp is None and self.config.response_cache_mode == "replay":
+                self.logger.error(f"Failed to download {tbd_url}.")
+                return
+            if resp is None:
+                try:
+                    fetched = await client.fetch(tbd_url, self.logger, MAX_FILE_SIZE)
+                    latency = time.perf_counter() - start
+                except DownloadAborted as e:
+                    latency = time.perf_counter() - start
+                    resp = aborted_response(tbd_url, str(e))
+                else:
+                    if fetched is None:
+                        self.logger.error(f"Failed to download {tbd_url}.")
+                        return
+                    status, content = fetched
+                    await self.loop.run_in_executor(executor, store_response, tbd_url, self.config, status, content)
+                    resp = await self.loop.run_in_executor(
+                        executor, build_response, tbd_url, status, content, self.logger)
+            await self.loop.run_in_executor(executor, self.handler.process_response, tbd_url, resp, latency)
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"An error occurred while processing URL {tbd_url}: {str(e)}")
+        finally:
+            await self._call_frontier(self.frontier.release_host, tbd_url)
+            slots.release()
+            self.wakeup.set()
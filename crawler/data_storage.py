@@ -1,59 +1,294 @@
 import datetime
-import fcntl
+import io
 import json
 import os
+import sys
 import threading
+import traceback
 from collections import Counter
 from pathlib import Path
+from urllib.parse import urldefrag, urlparse
 
 from sortedcontainers import SortedDict
 
+from crawler.fingerprint_log import FingerprintLog
+from crawler.fingerprint_table import DigestTable, SimhashTable
+from crawler.page_store import PageStore, delete_page_store
+from crawler.seen_index import DigestIndex
+from crawler.simhash_index import SimhashIndex
+from crawler.word_counter import WordCounter
+from utils import get_urlhash
 
-class DataStorage(object):
+
+MD5_RECORD_SIZE = 16
+SIMHASH_RECORD_SIZE = 8
+
+
+def digest_halves(digest):
+    """A 16-byte md5 digest as the two 64-bit DigestIndex halves, in the md5 log's byte order."""
+    return int.from_bytes(digest[:8], sys.byteorder), int.from_bytes(digest[8:], sys.byteorder)
+
+
+class SnapshotWriter(object):
+    """
+    Runs DataStorage's file writes on one background thread. Jobs are keyed
+    by what they write and only the newest job per key is kept, so a slow
+    disk delays writes but never lets them pile up.
+    """
     def __init__(self):
-        self.DATA_STORAGE_FILES = {
-            "unique_pages_count.json": ("visited_url", "visited_url_lock"),
-            "longest_content_page.json": ("longest_page", "longest_page_lock"),
-            "top50_common_words.json": ("common_words", "common_words_lock"),
-            "subdomains_stats.json": ("subdomains", "subdomains_lock")
-        }
+        self.jobs = {}
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def submit(self, key, job):
+        with self.condition:
+            if not self.closed:
+                self.jobs[key] = job
+                self.condition.notify()
+                return
+        job()
+
+
+    def close(self):
+        """Run the jobs still waiting, then stop."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.jobs and not self.closed:
+                    self.condition.wait()
+                if not self.jobs:
+                    return
+                jobs, self.jobs = self.jobs, {}
+            for job in jobs.values():
+                try:
+                    job()
+                except Exception:
+                    traceback.print_exc()
+
+
+class DataStorage(object):
+    """
+    The crawl's statistics. By default they are aggregates kept in memory;
+    with `page_store_file`, every crawled page is a row in a PageStore
+    instead and the reports are queries over it, so memory no longer grows
+    with the number of pages crawled.
+    """
+    def __init__(self, simhash_distance=3, fingerprint_dir=None, restart=False, word_sketch_width=0,
+                 page_store_file=None, commit_batch_size=500, durability_window=5):
         self.DATA_STORAGE_DIR = Path("../data_storage")
         self.DATA_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
         self.visited_url = set()
         self.longest_page = {"url": None, "word_count": 0}
-        self.common_words = {}
+        # Word frequencies summed over all pages, with the top 50 kept current.
+        self.common_words = WordCounter(top_k=50, sketch_width=word_sketch_width)
         self.subdomains = {}
-        self.md5_set = set()
-        self.simhash_set = set()
+        # Content fingerprints of every page that passed deduplication: its
+        # full md5 digest, and its simhash. With fingerprint logs, these only
+        # hold the fingerprints recorded since the last flush, and the rest
+        # are in the tables over the logs.
+        self.md5_index = DigestIndex()
+        # Pages whose simhash is within simhash_distance bits of an earlier
+        # page's count as near duplicates.
+        self.simhash_index = SimhashIndex(simhash_distance)
         self.visited_url_lock = threading.RLock()
         self.longest_page_lock = threading.RLock()
         self.common_words_lock = threading.RLock()
         self.subdomains_lock = threading.RLock()
-        self.md5_set_lock = threading.RLock()
-        self.simhash_set_lock = threading.RLock()
+        self.md5_index_lock = threading.RLock()
+        self.simhash_index_lock = threading.RLock()
+        self.fingerprint_flush_lock = threading.Lock()
+        self.writer = SnapshotWriter()
+        self.page_store = None
+        if page_store_file is not None:
+            if restart:
+                delete_page_store(page_store_file)
+            self.page_store = PageStore(page_store_file, commit_batch_size, durability_window)
+            self.common_words = self.page_store.words
+        self.md5_log = self.simhash_log = None
+        self.md5_table = self.simhash_table = None
+        if fingerprint_dir is not None:
+            self._open_fingerprint_logs(fingerprint_dir, restart)
+
+
+    def _open_fingerprint_logs(self, fingerprint_dir, restart):
+        os.makedirs(fingerprint_dir, exist_ok=True)
+        md5_path = os.path.join(fingerprint_dir, "md5.bin")
+        simhash_path = os.path.join(fingerprint_dir, "simhash.bin")
+        md5_table_path = os.path.join(fingerprint_dir, "md5.table")
+        simhash_table_path = os.path.join(fingerprint_dir, "simhash.table")
+        if restart:
+            for path in (md5_path, simhash_path, md5_table_path, simhash_table_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.md5_log = FingerprintLog(md5_path, MD5_RECORD_SIZE)
+        self.simhash_log = FingerprintLog(simhash_path, SIMHASH_RECORD_SIZE)
+        # Logged fingerprints are looked up in the mapped tables, which only
+        # need the log records they do not hold yet: none after a clean
+        # shutdown, all of them once for logs written without tables, or
+        # after a crash in the middle of a flush.
+        self.md5_table = DigestTable(md5_table_path)
+        self.md5_table.catch_up(self.md5_log.loaded)
+        self.simhash_table = SimhashTable(simhash_table_path, self.simhash_index.max_distance)
+        self.simhash_table.catch_up(self.simhash_log.loaded)
+
+
+    def add_page(self, url, status, byte_size, word_count=None, md5=None, simhash=None, depth=None, latency=None):
+        """
+        Record a crawled page in the page store. `word_count` and the
+        fingerprints are None for pages that were not scraped, and
+        `latency` is the fetch time in seconds.
+        """
+        url_without_fragment, _ = urldefrag(url)
+        self.page_store.add_page(
+            get_urlhash(url_without_fragment), url_without_fragment, urlparse(url).hostname, status,
+            word_count, byte_size, md5, simhash, depth, latency)
+
+
+    def add_content_md5(self, digest):
+        """Record a page's md5 digest; return False if an earlier page had it."""
+        halves = digest_halves(digest)
+        with self.md5_index_lock:
+            if self.md5_table is not None and halves in self.md5_table:
+                return False
+            if not self.md5_index.add(*halves):
+                return False
+            if self.md5_log is not None:
+                self.md5_log.append(digest)
+            return True
+
+
+    def add_content_simhash(self, simhash):
+        """Record a page's simhash; return False if it is a near duplicate of an earlier page's."""
+        with self.simhash_index_lock:
+            if self.simhash_table is not None and simhash in self.simhash_table:
+                return False
+            if not self.simhash_index.add_if_new(simhash):
+                return False
+            if self.simhash_log is not None:
+                self.simhash_log.append(simhash.to_bytes(SIMHASH_RECORD_SIZE, sys.byteorder))
+            return True
+
+
+    def flush_fingerprints(self):
+        """Write the fingerprints recorded since the last flush to the logs, then move them into the tables."""
+        with self.fingerprint_flush_lock:
+            with self.md5_index_lock:
+                md5_log, md5_table = self.md5_log, self.md5_table
+            if md5_log is not None:
+                self._flush_fingerprint_log(md5_log, md5_table, self.md5_index_lock, self._reset_md5_index)
+            with self.simhash_index_lock:
+                simhash_log, simhash_table = self.simhash_log, self.simhash_table
+            if simhash_log is not None:
+                self._flush_fingerprint_log(
+                    simhash_log, simhash_table, self.simhash_index_lock, self._reset_simhash_index)
+
+
+    @staticmethod
+    def _flush_fingerprint_log(log, table, lock, reset_index):
+        # The records are detached under the lock and written, and the table
+        # synced, after releasing it, so workers are not held up by the
+        # fsyncs. They stay in the in-memory index until they are in the
+        # table; then it starts over from the records appended since.
+        with lock:
+            records = log.take_pending()
+        if not records:
+            return
+        log.write(records)
+        table.start_update()
+        with lock:
+            table.add_records(records)
+            reset_index(log.pending)
+        table.finish_update()
+
+
+    def _reset_md5_index(self, records):
+        self.md5_index = DigestIndex()
+        with memoryview(records).cast("Q") as words:
+            for head, tail in zip(words[::2], words[1::2]):
+                self.md5_index.add(head, tail)
+
+
+    def _reset_simhash_index(self, records):
+        self.simhash_index = SimhashIndex(self.simhash_index.max_distance)
+        with memoryview(records).cast("Q") as simhashes:
+            for simhash in simhashes:
+                self.simhash_index.add(simhash)
+
+
+    def close(self):
+        self.writer.close()
+        if self.page_store is not None:
+            self.page_store.close()
+        self.flush_fingerprints()
+        with self.md5_index_lock:
+            if self.md5_log is not None:
+                self.md5_log.close()
+                self.md5_table.close()
+                self.md5_log = self.md5_table = None
+        with self.simhash_index_lock:
+            if self.simhash_log is not None:
+                self.simhash_log.close()
+                self.simhash_table.close()
+                self.simhash_log = self.simhash_table = None
+
+
+    def snapshot(self):
+        """
+        Copy the statistics the crawler reports. Each lock is held only for
+        its copy: the visited urls are counted rather than copied, and the
+        top words are already maintained by the WordCounter. With a page
+        store, the statistics are queries over its tables.
+        """
+        if self.page_store is not None:
+            return {
+                "unique_pages_count": self.page_store.unique_pages_count(),
+                "longest_page": self.page_store.longest_page(),
+                "top50_common_words": dict(self.common_words.top(50)),
+                "subdomains": self.page_store.subdomain_counts(),
+            }
+        with self.visited_url_lock:
+            unique_pages_count = len(self.visited_url)
+        with self.longest_page_lock:
+            longest_page = dict(self.longest_page)
+        with self.common_words_lock:
+            top50_common_words = dict(self.common_words.top(50))
+        with self.subdomains_lock:
+            subdomains = dict(self.subdomains)
+        return {
+            "unique_pages_count": unique_pages_count,
+            "longest_page": longest_page,
+            "top50_common_words": top50_common_words,
+            "subdomains": subdomains,
+        }
 
 
     def store_scraped_data(self):
-        for output_file_name, (data_key, lock_name) in self.DATA_STORAGE_FILES.items():
-            with getattr(self, lock_name):
-                print(lock_name)
-                data = getattr(self, data_key)
-                output_file_path = self.DATA_STORAGE_DIR / output_file_name
-
-                if data_key == "visited_url" and lock_name == "visited_url_lock":
-                    self._store_unique_pages_count(output_file_path, data)
-                elif data_key == "longest_page" and lock_name == "longest_page_lock":
-                    self._store_longest_page(output_file_path, data)
-                elif data_key == "subdomains" and lock_name == "subdomains_lock":
-                    self._store_subdomains_stats(output_file_path, data)
-                elif data_key == "common_words" and lock_name == "common_words_lock":
-                    self._store_top50_common_words(output_file_path, data)
+        """Snapshot the statistics and write them on the writer thread; returns at once."""
+        snapshot = self.snapshot()
+        self.writer.submit("scraped_data", lambda: self._store_snapshot(snapshot))
+
+
+    def _store_snapshot(self, snapshot):
+        self._store_unique_pages_count(
+            self.DATA_STORAGE_DIR / "unique_pages_count.json", snapshot["unique_pages_count"])
+        self._store_longest_page(self.DATA_STORAGE_DIR / "longest_content_page.json", snapshot["longest_page"])
+        self._store_top50_common_words(
+            self.DATA_STORAGE_DIR / "top50_common_words.json", snapshot["top50_common_words"])
+        self._store_subdomains_stats(self.DATA_STORAGE_DIR / "subdomains_stats.json", snapshot["subdomains"])
 
 
     def _store_top50_common_words(self, file_path, data):
-        top_50_common_words = dict(sorted(data.items(), key=lambda item: item[1], reverse=True)[:50])
-        self._write_json(file_path, top_50_common_words)
-        print("top_50_common_words(): " + str(top_50_common_words))
+        self._write_json(file_path, data)
+        print("top_50_common_words(): " + str(data))
 
 
     def _store_longest_page(self, file_path, data):
@@ -62,8 +297,8 @@ class DataStorage(object):
 
 
     def _store_unique_pages_count(self, file_path, data):
-        self._write_json(file_path, len(data))
-        print("store_unique_pages_count(): " + str(len(data)))
+        self._write_json(file_path, data)
+        print("store_unique_pages_count(): " + str(data))
 
 
     def _store_subdomains_stats(self, file_path, data):
@@ -72,6 +307,11 @@ class DataStorage(object):
         print("subdomains: " + str(sorted_subdomains))
 
 
+    def store_json(self, file_name, data):
+        """Write `data`, which the caller must not change afterwards, on the writer thread."""
+        self.writer.submit(file_name, lambda: self._write_json(self.DATA_STORAGE_DIR / file_name, data))
+
+
     def _read_json(self, file_path):
         try:
             if os.path.getsize(file_path) == 0:
@@ -86,18 +326,25 @@ class DataStorage(object):
 
     def _write_json(self, file_path, data):
         try:
-            with open(file_path, "w") as f:
-                fcntl.flock(f, fcntl.LOCK_EX)
-                json.dump(self._convert_sets_to_lists(data), f)
-                f.flush()  # Flush the internal buffer
-                os.fsync(f.fileno())
-                fcntl.flock(f, fcntl.LOCK_UN)
+            self._write_atomically(file_path, json.dumps(self._convert_sets_to_lists(data)))
         except TypeError as e:
             print(f"Type error when writing JSON to {file_path}: {str(e)}")
         except Exception as e:
             print(f"Error writing JSON to {file_path}: {str(e)}")
 
 
+    @staticmethod
+    def _write_atomically(file_path, text):
+        # Readers, and the file after a crash, see either the old or the new
+        # contents, never a truncated mix.
+        temp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+
+
     def _convert_sets_to_lists(self, obj):
         if isinstance(obj, set):
             return list(obj)
@@ -110,36 +357,28 @@ class DataStorage(object):
 
 
     def finalize_data(self):
-        output_file_path = self.DATA_STORAGE_DIR / "final_results_summary.txt"
-
-        with open(output_file_path, "a") as output_file:
-            fcntl.flock(output_file, fcntl.LOCK_EX)
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            output_file.write(f"Data finalization started at {current_time}\n")
-            output_file.write("-------------------------------\n")
-
-            for _, (data_key, lock_name) in self.DATA_STORAGE_FILES.items():
-                with getattr(self, lock_name):
-                    data = getattr(self, data_key)
-                    if data_key == "visited_url" and lock_name == "visited_url_lock":
-                        self._finalize_unique_pages_count(output_file, data)
-                    elif data_key == "longest_page" and lock_name == "longest_page_lock":
-                        self._finalize_longest_content_page(output_file, data)
-                    elif data_key == "subdomains" and lock_name == "subdomains_lock":
-                        self._finalize_subdomains_stats(output_file, data)
-                    elif data_key == "common_words" and lock_name == "common_words_lock":
-                        self._finalize_top50_common_words(output_file, data)
-
-            output_file.write("\n\n\n")
-            output_file.flush()
-            os.fsync(output_file.fileno())
-            fcntl.flock(output_file, fcntl.LOCK_UN)
+        """
+        Write the human readable summary of the crawl, replacing the last
+        one. Run at shutdown, or whenever a summary is wanted.
+        """
+        snapshot = self.snapshot()
+        output_file = io.StringIO()
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        output_file.write(f"Data finalization started at {current_time}\n")
+        output_file.write("-------------------------------\n")
+        self._finalize_unique_pages_count(output_file, snapshot["unique_pages_count"])
+        self._finalize_longest_content_page(output_file, snapshot["longest_page"])
+        self._finalize_top50_common_words(output_file, snapshot["top50_common_words"])
+        self._finalize_subdomains_stats(output_file, snapshot["subdomains"])
+        try:
+            self._write_atomically(self.DATA_STORAGE_DIR / "final_results_summary.txt", output_file.getvalue())
+        except Exception as e:
+            print(f"Error writing the results summary: {str(e)}")
 
 
     def _finalize_top50_common_words(self, output_file, data):
-        top50_common_words = dict(sorted(data.items(), key=lambda item: item[1], reverse=True)[:50])
         output_file.write("Top 50 Common Words:\n")
-        for word, count in top50_common_words.items():
+        for word, count in data.items():
             output_file.write(f"{word}: {count}\n")
         output_file.write("-------------------------------\n")
 
@@ -160,7 +399,7 @@ class DataStorage(object):
 
 
     def _finalize_unique_pages_count(self, output_file, data):
-        output_file.write("Unique Pages Count: " + str(len(data)) + "\n")
+        output_file.write("Unique Pages Count: " + str(data) + "\n")
         output_file.write("-------------------------------\n")
 
 
@@ -0,0 +1,75 @@
+import mmap
+import os
+
+
+class FingerprintLog(object):
+    """
+    Append-only file of fixed-width binary records, such as 16-byte md5
+    digests or 8-byte simhashes (native byte order, as array('Q') writes
+    them).
+
+    The records already in the file are memory-mapped read-only at open and
+    exposed as `loaded`, a memoryview, so reading them needs no file reads
+    or decoding and the pages are shared with any other process mapping the
+    same file (open it with readonly=True there). Lookups are up to the
+    caller; DataStorage makes them in a FingerprintTable over the log.
+    Appended records are buffered and written by flush(), or by
+    take_pending() and write() when the caller must not hold its lock
+    during the disk write; a torn record left at the end by a crash is cut
+    off on open.
+    """
+    def __init__(self, path, record_size, readonly=False):
+        self.path = path
+        self.record_size = record_size
+        self.readonly = readonly
+        self.pending = bytearray()
+        self.fd = os.open(path, os.O_RDONLY if readonly else os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        size = os.fstat(self.fd).st_size
+        torn = size % record_size
+        if torn:
+            size -= torn
+            if not readonly:
+                os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size, access=mmap.ACCESS_READ) if size else None
+        self.loaded = memoryview(self.map) if self.map is not None else memoryview(b"")
+        self.loaded_count = size // record_size
+        self.count = self.loaded_count
+
+
+    def __len__(self):
+        return self.count
+
+
+    def append(self, record):
+        assert len(record) == self.record_size, f"records are {self.record_size} bytes"
+        self.pending += record
+        self.count += 1
+
+
+    def take_pending(self):
+        """Detach the records appended since the last call, for write()."""
+        pending, self.pending = self.pending, bytearray()
+        return pending
+
+
+    def write(self, records):
+        """Write records taken with take_pending() and fsync them."""
+        if self.readonly or not records:
+            return
+        with memoryview(records) as view:
+            written = 0
+            while written < len(view):
+                written += os.write(self.fd, view[written:])
+        os.fsync(self.fd)
+
+
+    def flush(self):
+        self.write(self.take_pending())
+
+
+    def close(self):
+        self.flush()
+        self.loaded.release()
+        if self.map is not None:
+            self.map.close()
+        os.close(self.fd)
@@ -0,0 +1,220 @@
+import mmap
+import os
+
+from crawler.simhash_index import DEFAULT_BUCKET_BITS, block_keys, popcount
+
+
+MAGIC = int.from_bytes(b"fptable1", "little")
+# Words of the header, which is padded to HEADER_WORDS.
+MAGIC_WORD, LAYOUT_WORD, PARAMETER_WORD, COUNT_WORD, CAPACITY_WORD, DIRTY_WORD = range(6)
+HEADER_WORDS = 8
+INITIAL_CAPACITY = 1 << 16
+DIGEST_KEY_BITS = 20
+
+
+class FingerprintTable(object):
+    """
+    Index over the records of a FingerprintLog, in a file of its own mapped
+    read-write, so that a resumed crawl looks fingerprints up in the mapped
+    pages instead of first rebuilding an index in memory from the log.
+
+    The file holds `table_count` tables of 2 ** key_bits chain heads, one
+    per key a record is filed under, then the records in log order, each
+    followed by the next entry of its chain in every table (entry numbers
+    start at 1; 0 ends a chain). Adding a record writes its entry and
+    relinks the heads, so the file grows with the log, by doubling, and is
+    never rehashed. Lookups walk the chains of the record's keys, which are
+    as long as the number of records sharing a key.
+
+    The header counts the log records the table holds. Additions go between
+    start_update() and finish_update(), which sync the file; a table that a
+    crash left in the middle of an update, or that does not fit the log, is
+    rebuilt from the log by catch_up().
+
+    Not thread safe; DataStorage uses it under the lock of the in-memory
+    index of the same fingerprints.
+    """
+    def __init__(self, path, record_words, table_count, key_bits, parameter=0):
+        self.path = path
+        self.record_words = record_words
+        self.table_count = table_count
+        self.key_bits = key_bits
+        self.entry_words = record_words + table_count
+        self.entries_start = HEADER_WORDS + (table_count << key_bits)
+        self.layout = record_words | table_count << 8 | key_bits << 16
+        self.parameter = parameter
+        self.map = self.words = None
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self.fd).st_size
+        if size >= 8 * HEADER_WORDS:
+            self._map(size)
+        if not self._fits(size):
+            self._reset()
+
+
+    def __len__(self):
+        return self.words[COUNT_WORD]
+
+
+    def catch_up(self, records):
+        """Add the records of `records`, all of the log's, that the table does not hold yet."""
+        record_size = 8 * self.record_words
+        if self.words[DIRTY_WORD] or len(self) > len(records) // record_size:
+            self._reset()
+        if len(self) < len(records) // record_size:
+            self.start_update()
+            self.add_records(records[len(self) * record_size:])
+            self.finish_update()
+
+
+    def start_update(self):
+        self.words[DIRTY_WORD] = 1
+        self.map.flush(0, mmap.PAGESIZE)
+
+
+    def add_records(self, records):
+        """Add whole log records, in log order."""
+        record_words = self.record_words
+        with memoryview(records).cast("Q") as new_words:
+            for start in range(0, len(new_words), record_words):
+                self._add(new_words[start:start + record_words])
+
+
+    def finish_update(self):
+        self.map.flush()
+        self.words[DIRTY_WORD] = 0
+        self.map.flush(0, mmap.PAGESIZE)
+
+
+    def close(self):
+        self.words.release()
+        self.map.close()
+        os.close(self.fd)
+
+
+    def _keys(self, record):
+        """The key `record` is filed under in each table."""
+        raise NotImplementedError
+
+
+    def _add(self, record):
+        index = self.words[COUNT_WORD]
+        if index == self.words[CAPACITY_WORD]:
+            self._grow()
+        words = self.words
+        entry = self.entries_start + index * self.entry_words
+        words[entry:entry + self.record_words] = record
+        for table, key in enumerate(self._keys(record)):
+            head = HEADER_WORDS + (table << self.key_bits) + key
+            words[entry + self.record_words + table] = words[head]
+            words[head] = index + 1
+        words[COUNT_WORD] = index + 1
+
+
+    def _size(self, capacity):
+        return 8 * (self.entries_start + capacity * self.entry_words)
+
+
+    def _fits(self, size):
+        words = self.words
+        return (words is not None and words[MAGIC_WORD] == MAGIC and words[LAYOUT_WORD] == self.layout
+                and words[PARAMETER_WORD] == self.parameter and size == self._size(words[CAPACITY_WORD])
+                and words[COUNT_WORD] <= words[CAPACITY_WORD])
+
+
+    def _map(self, size):
+        if self.map is not None:
+            self.words.release()
+            self.map.close()
+        self.map = mmap.mmap(self.fd, size)
+        self.words = memoryview(self.map).cast("Q")
+
+
+    def _reset(self):
+        os.ftruncate(self.fd, 0)
+        os.ftruncate(self.fd, self._size(INITIAL_CAPACITY))
+        self._map(self._size(INITIAL_CAPACITY))
+        words = self.words
+        words[MAGIC_WORD] = MAGIC
+        words[LAYOUT_WORD] = self.layout
+        words[PARAMETER_WORD] = self.parameter
+        words[CAPACITY_WORD] = INITIAL_CAPACITY
+        self.map.flush()
+
+
+    def _grow(self):
+        # The entries are at the end of the file, so growing it leaves them
+        # in place and only needs a larger mapping.
+        capacity = 2 * self.words[CAPACITY_WORD]
+        self.words[CAPACITY_WORD] = capacity
+        os.ftruncate(self.fd, self._size(capacity))
+        self._map(self._size(capacity))
+
+
+class DigestTable(FingerprintTable):
+    """
+    FingerprintTable of 16-byte md5 digests, filed under the low `key_bits`
+    bits of their first half; with the default 20 bits, chains are about 10
+    entries long at 10M pages. Looked up by the halves DigestIndex takes.
+    """
+    def __init__(self, path, key_bits=DIGEST_KEY_BITS):
+        self.key_mask = (1 << key_bits) - 1
+        super().__init__(path, record_words=2, table_count=1, key_bits=key_bits)
+
+
+    def __contains__(self, halves):
+        head, tail = halves
+        words = self.words
+        entries_start = self.entries_start
+        entry = words[HEADER_WORDS + (head & self.key_mask)]
+        while entry:
+            start = entries_start + 3 * (entry - 1)
+            if words[start] == head and words[start + 1] == tail:
+                return True
+            entry = words[start + 2]
+        return False
+
+
+    def _keys(self, record):
+        return (record[0] & self.key_mask,)
+
+
+class SimhashTable(FingerprintTable):
+    """
+    FingerprintTable of 64-bit simhashes answering SimhashIndex's question,
+    "is any stored fingerprint within `max_distance` bits of this one?", with
+    the same blocks: one table per block, keyed by its top `bucket_bits`
+    bits, so a chain is one of SimhashIndex's buckets.
+    """
+    def __init__(self, path, max_distance=3, bucket_bits=DEFAULT_BUCKET_BITS):
+        self.max_distance = max_distance
+        self.keys = block_keys(max_distance, bucket_bits)
+        key_bits = max(mask.bit_length() for _, mask in self.keys)
+        super().__init__(path, record_words=1, table_count=len(self.keys), key_bits=key_bits,
+                         parameter=max_distance)
+
+
+    def find(self, fingerprint):
+        """Return a stored fingerprint within max_distance of `fingerprint`, or None."""
+        words = self.words
+        entries_start = self.entries_start
+        entry_words = self.entry_words
+        max_distance = self.max_distance
+        for table, (shift, mask) in enumerate(self.keys):
+            entry = words[HEADER_WORDS + (table << self.key_bits) + ((fingerprint >> shift) & mask)]
+            while entry:
+                start = entries_start + entry_words * (entry - 1)
+                candidate = words[start]
+                if popcount(candidate ^ fingerprint) <= max_distance:
+                    return candidate
+                entry = words[start + 1 + table]
+        return None
+
+
+    def __contains__(self, fingerprint):
+        return self.find(fingerprint) is not None
+
+
+    def _keys(self, record):
+        fingerprint = record[0]
+        return [(fingerprint >> shift) & mask for shift, mask in self.keys]
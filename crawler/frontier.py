@@ -1,26 +1,53 @@
-import asyncio
+import heapq
 import os
-import shelve
+import shutil
+import time
 from collections import defaultdict
-from queue import Queue, Empty, PriorityQueue
-from threading import Thread, RLock
+from threading import Thread, RLock, Condition, Event
 from urllib.parse import urlparse
 
 from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from utils.url_filter import UrlFilter
+from crawler.trap_detector import TrapDetector
+from crawler.frontier_store import open_frontier_store, delete_frontier_store
+from crawler.seen_index import SeenIndex, url_fingerprint
+from crawler.host_queue import HostQueue
 
 
 MAX_DEPTH = 500
+LOAD_CHUNK_SIZE = 1000
 
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = PriorityQueue()
+        self.url_filter = UrlFilter(config.allowed_domains)
+        self.trap_detector = TrapDetector(
+            config.trap_min_samples, config.trap_ban_yield, config.trap_throttle_yield, self.logger,
+            config.trap_max_templates)
+        # One HostQueue of (priority, url) per host, plus a heap of
+        # (next allowed fetch time, host) for hosts that have work queued.
+        self.host_queues = {}
+        self.ready_hosts = []
+        self.scheduled_hosts = set()
+        self.busy_hosts = set()
+        self.host_ready_time = {}
         self.domain_counts = defaultdict(int)
-        self.url_depth = {}
+        # Every url ever discovered, as a 64-bit fingerprint with its depth.
+        self.seen_urls = SeenIndex(config.seen_index_capacity, config.bloom_filter_capacity)
         self.frontier_lock = RLock()
+        self.url_available = Condition(self.frontier_lock)
+        # Urls held in memory across all host queues; once the budget is
+        # reached further urls are spilled to segment files in spill_dir.
+        self.memory_budget = config.frontier_memory_budget
+        self.queued_in_memory = 0
+        self.spilling_queues = set()
+        # Spilled urls are also in the pending index, so old segments from
+        # a previous run are just discarded.
+        shutil.rmtree(config.spill_dir, ignore_errors=True)
+        if self.memory_budget:
+            os.makedirs(config.spill_dir)
 
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
@@ -33,91 +60,266 @@ class Frontier(object):
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it."
             )
-            os.remove(self.config.save_file)
+            delete_frontier_store(self.config.save_file)
             # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
-        if restart:
+        self.save = open_frontier_store(self.config)
+        # True while a resumed save file is still being read in the background.
+        self.loading = False
+        self.closing = Event()
+        if restart or not self.save:
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
+            # Set the frontier state with contents of save file. Urls are
+            # served as soon as the first chunk of pending ones is queued.
+            self.loading = True
+            self.loader = Thread(target=self._load_save_file, daemon=True)
+            self.loader.start()
 
 
-    def _parse_save_file(self):
-        with self.frontier_lock:
-            total_count = len(self.save)
+    def _load_save_file(self):
+        try:
             tbd_count = 0
-            for url, completed in self.save.values():
-                if not completed and is_valid(url):
-                    priority = self.get_url_depth(url)
-                    self.to_be_downloaded.put((priority, url))
-                    tbd_count += 1
+            for chunk in self.save.pending_chunks(LOAD_CHUNK_SIZE):
+                if self.closing.is_set():
+                    return
+                valid_urls = set(self.url_filter.filter_urls([entry[1] for entry in chunk]))
+                valid_entries = [entry for entry in chunk if entry[1] in valid_urls]
+                with self.frontier_lock:
+                    for urlhash, url, priority, depth in valid_entries:
+                        # Urls discovered since the load started are already
+                        # queued, so only unseen ones are added.
+                        if self.seen_urls.add(url_fingerprint(urlhash), depth):
+                            domain = urlparse(url).netloc
+                            self.domain_counts[domain] = max(self.domain_counts[domain], priority)
+                            self._enqueue(priority, url)
+                            tbd_count += 1
+                    self._flush_spills()
+
+            # The rest of the seen set needs no validation, only hashes.
+            total_count = 0
+            for chunk in self.save.urlhash_chunks(LOAD_CHUNK_SIZE):
+                if self.closing.is_set():
+                    return
+                with self.frontier_lock:
+                    for urlhash in chunk:
+                        self.seen_urls.add(url_fingerprint(urlhash))
+                total_count += len(chunk)
             self.logger.info(
                 f"Found {tbd_count} urls to be downloaded from {total_count} "
                 f"total urls discovered."
             )
+        finally:
+            with self.url_available:
+                self.loading = False
+                self.url_available.notify_all()
 
 
-    def get_tbd_url(self):
-        try:
-            _, url = self.to_be_downloaded.get_nowait()
-            return url
-        except Empty:
-            return None
+    def get_tbd_url(self, timeout=None):
+        """
+        Return a url whose host may be fetched right now, blocking until the
+        earliest scheduled host becomes ready.
+
+        Returns None once nothing is queued and no host is being fetched (the
+        crawl is over), or when `timeout` seconds pass without a host becoming
+        ready. Every url handed out must be followed by `release_host(url)`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.url_available:
+            while True:
+                wait = None
+                if self.ready_hosts:
+                    ready_time, host = self.ready_hosts[0]
+                    wait = ready_time - time.monotonic()
+                    if wait <= 0:
+                        heapq.heappop(self.ready_hosts)
+                        self.scheduled_hosts.discard(host)
+                        url = self._pop_url(host)
+                        if url is None:
+                            # Everything queued for the host was banned.
+                            continue
+                        self.busy_hosts.add(host)
+                        return url
+                elif not self.busy_hosts and not self.loading:
+                    return None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.url_available.wait(wait)
+
+
+    def _pop_url(self, host):
+        # Urls of templates banned since they were queued are dropped here
+        # and count as complete.
+        queue = self.host_queues[host]
+        url = None
+        while queue:
+            self.queued_in_memory += queue.page_in()
+            _, url = queue.pop()
+            self.queued_in_memory -= 1
+            if not self.trap_detector.is_banned(url):
+                break
+            self.save.mark_complete(get_urlhash(url), url)
+            url = None
+        if not queue:
+            del self.host_queues[host]
+        return url
+
+
+    def release_host(self, url):
+        """
+        Report that the fetch of `url` is over, so its host may be fetched
+        again once the politeness delay has passed.
+        """
+        host = urlparse(url).netloc
+        with self.url_available:
+            self.busy_hosts.discard(host)
+            self.host_ready_time[host] = time.monotonic() + self.config.time_delay
+            if host in self.host_queues:
+                self._schedule_host(host)
+            self.url_available.notify_all()
+
+
+    def next_ready_in(self):
+        """Seconds until the earliest queued host may be fetched, or None."""
+        with self.frontier_lock:
+            if not self.ready_hosts:
+                return None
+            return max(0, self.ready_hosts[0][0] - time.monotonic())
+
+
+    def is_exhausted(self):
+        with self.frontier_lock:
+            return not self.ready_hosts and not self.busy_hosts and not self.loading
+
+
+    def _enqueue(self, priority, url):
+        host = urlparse(url).netloc
+        with self.url_available:
+            queue = self.host_queues.get(host)
+            if queue is None:
+                queue = self.host_queues[host] = HostQueue(host, self.config.spill_dir)
+            if queue.spilled_count or (self.memory_budget and self.queued_in_memory >= self.memory_budget):
+                queue.spill(priority, url)
+                self.spilling_queues.add(queue)
+            else:
+                queue.push(priority, url)
+                self.queued_in_memory += 1
+            if host not in self.busy_hosts and host not in self.scheduled_hosts:
+                self._schedule_host(host)
+                self.url_available.notify()
+
+
+    def _flush_spills(self):
+        # Called once per batch of _enqueue calls, so each spilling host
+        # gets one segment write per batch.
+        with self.frontier_lock:
+            for queue in self.spilling_queues:
+                queue.flush()
+            self.spilling_queues.clear()
+
+
+    def _schedule_host(self, host):
+        ready_time = self.host_ready_time.get(host, 0)
+        heapq.heappush(self.ready_hosts, (ready_time, host))
+        self.scheduled_hosts.add(host)
 
 
     def get_url_depth(self, url):
+        fingerprint = url_fingerprint(get_urlhash(normalize(url)))
         with self.frontier_lock:
-            return self.url_depth.get(url, 0)
+            return self.seen_urls.get_depth(fingerprint, 0)
 
 
     def set_url_depth(self, url, depth):
+        fingerprint = url_fingerprint(get_urlhash(normalize(url)))
         with self.frontier_lock:
-            self.url_depth[url] = depth
+            self.seen_urls.set_depth(fingerprint, depth)
 
 
     def increase_url_depth(self, url, increment=1):
         with self.frontier_lock:
-            current_depth = self.url_depth.get(url, 0)
-            self.url_depth[url] = current_depth + increment
+            self.set_url_depth(url, self.get_url_depth(url) + increment)
 
 
     def add_url(self, url, parent_url=None):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc
+        self.add_urls([url], parent_url)
+
+
+    def add_urls(self, urls, parent_url=None):
+        # Normalize, hash and dedupe the batch before taking the lock.
+        batch = {}
+        for url in urls:
+            url = normalize(url)
+            urlhash = get_urlhash(url)
+            batch.setdefault(url_fingerprint(urlhash), (urlhash, url))
+        if not batch:
+            return
+
         with self.frontier_lock:
-            if urlhash not in self.save:
-                if parent_url is not None:
-                    parent_depth = self.get_url_depth(parent_url)
-                    current_depth = parent_depth + 1
-                else:
-                    current_depth = 0
-
-                if current_depth > MAX_DEPTH:
-                    self.logger.info(f"URL {url} is too deep ({current_depth}), skipping.")
-                    return
+            if parent_url is not None:
+                current_depth = self.get_url_depth(parent_url) + 1
+            else:
+                current_depth = 0
+
+            new_urls = [
+                (fingerprint, urlhash, url) for fingerprint, (urlhash, url) in batch.items()
+                if fingerprint not in self.seen_urls
+            ]
+            if new_urls and self.loading:
+                # The seen index is incomplete until the load finishes.
+                stored = self.save.seen([urlhash for _, urlhash, _ in new_urls])
+                new_urls = [entry for entry in new_urls if entry[1] not in stored]
+            if not new_urls:
+                return
+            if current_depth > MAX_DEPTH:
+                self.logger.info(
+                    f"{len(new_urls)} urls from {parent_url} are too deep ({current_depth}), skipping."
+                )
+                return
 
-                self.save[urlhash] = (url, False)
-                self.save.sync()
+            pending = []
+            for fingerprint, urlhash, url in new_urls:
+                self.seen_urls.add(fingerprint, current_depth)
+                penalty = self.trap_detector.discovered(url)
+                if penalty is None:
+                    continue
+                domain = urlparse(url).netloc
                 self.domain_counts[domain] += 1
-                priority = self.domain_counts[domain]
-                self.to_be_downloaded.put((priority, url))
-                self.set_url_depth(url, current_depth)
+                # Throttled templates queue behind the rest of their host.
+                priority = self.domain_counts[domain] + penalty
+                self._enqueue(priority, url)
+                pending.append((urlhash, url, priority, current_depth))
+            self._flush_spills()
+            self.save.add_pending(pending)
+
+
+    def record_content(self, url, unique, text_fingerprint=None):
+        """Report whether the page fetched from `url` had unique content."""
+        with self.frontier_lock:
+            self.trap_detector.record(url, unique, text_fingerprint)
 
 
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
         with self.frontier_lock:
-            if urlhash not in self.save:
+            if url_fingerprint(urlhash) not in self.seen_urls and not (self.loading and urlhash in self.save):
                 self.logger.error(
                     f"Completed url {url}, but have not seen it before."
                 )
             else:
-                self.save[urlhash] = (url, True)
-                self.save.sync()
+                self.save.mark_complete(urlhash, url)
+
+
+    def commit(self):
+        """Write the buffered frontier changes to the save file now."""
+        self.save.commit()
+
+
+    def close(self):
+        self.closing.set()
+        if self.loading:
+            self.loader.join()
+        self.save.close()
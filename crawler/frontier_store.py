@@ -0,0 +1,339 @@
+import os
+import shelve
+import sqlite3
+import traceback
+from threading import Thread, RLock, Event
+
+
+class FrontierStore(object):
+    """
+    Persistent frontier state: urlhash -> (url, completed) for every url
+    discovered, plus a separate index of the pending ones with their
+    priority and depth, so resuming only has to read outstanding work.
+
+    Writes are buffered in memory and committed as one batch by a
+    background thread, once `commit_size` of them are waiting or at the
+    latest every `commit_interval` seconds, so a crash loses at most that
+    window. Callers never write to disk themselves: they add to the buffer
+    and, when it is full, wake the flusher. A failed commit keeps the batch
+    buffered for the next attempt. Subclasses only implement the raw storage
+    operations.
+    """
+    def __init__(self, path, commit_size, commit_interval):
+        self.path = path
+        self.commit_size = commit_size
+        self.commit_interval = commit_interval
+        self.store_lock = RLock()
+        # urlhash -> (url, completed, priority, depth)
+        self.dirty = {}
+        self._commit_requested = Event()
+        self._closed = Event()
+        self._flusher = Thread(target=self._commit_periodically, daemon=True)
+        self._flusher.start()
+
+
+    def __contains__(self, urlhash):
+        return self.get(urlhash) is not None
+
+
+    def __len__(self):
+        with self.store_lock:
+            self.commit()
+            return self._count()
+
+
+    def __bool__(self):
+        with self.store_lock:
+            return bool(self.dirty) or not self._is_empty()
+
+
+    def get(self, urlhash):
+        with self.store_lock:
+            if urlhash in self.dirty:
+                url, completed, _, _ = self.dirty[urlhash]
+                return url, completed
+            return self._read(urlhash)
+
+
+    def seen(self, urlhashes):
+        """Return the subset of `urlhashes` already in the store."""
+        with self.store_lock:
+            found = {urlhash for urlhash in urlhashes if urlhash in self.dirty}
+            missing = [urlhash for urlhash in urlhashes if urlhash not in found]
+            if missing:
+                found.update(self._read_many(missing))
+            return found
+
+
+    def add_pending(self, entries):
+        """Record newly discovered (urlhash, url, priority, depth) entries."""
+        with self.store_lock:
+            for urlhash, url, priority, depth in entries:
+                self.dirty[urlhash] = (url, False, priority, depth)
+            if len(self.dirty) >= self.commit_size:
+                self._commit_requested.set()
+
+
+    def mark_complete(self, urlhash, url):
+        with self.store_lock:
+            self.dirty[urlhash] = (url, True, 0, 0)
+            if len(self.dirty) >= self.commit_size:
+                self._commit_requested.set()
+
+
+    def pending_chunks(self, chunk_size):
+        """Yield lists of pending (urlhash, url, priority, depth) entries."""
+        self.commit()
+        after = None
+        while True:
+            with self.store_lock:
+                chunk, after = self._read_pending(after, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+    def urlhash_chunks(self, chunk_size):
+        """Yield lists of the hashes of every url discovered."""
+        self.commit()
+        after = None
+        while True:
+            with self.store_lock:
+                chunk, after = self._read_urlhashes(after, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+    def commit(self):
+        with self.store_lock:
+            if self.dirty:
+                # Cleared only once written; on an error the batch stays
+                # buffered and is retried with the next commit.
+                self._write(self.dirty)
+                self.dirty = {}
+
+
+    def close(self):
+        self._closed.set()
+        self._commit_requested.set()
+        self._flusher.join()
+        with self.store_lock:
+            self.commit()
+            self._close()
+
+
+    def _commit_periodically(self):
+        while not self._closed.is_set():
+            self._commit_requested.wait(self.commit_interval)
+            self._commit_requested.clear()
+            try:
+                self.commit()
+            except Exception:
+                traceback.print_exc()
+
+
+    def _read(self, urlhash):
+        raise NotImplementedError
+
+
+    def _read_many(self, urlhashes):
+        return [urlhash for urlhash in urlhashes if self._read(urlhash) is not None]
+
+
+    def _read_pending(self, after, limit):
+        # Return (entries, cursor to pass as `after` for the next chunk).
+        raise NotImplementedError
+
+
+    def _read_urlhashes(self, after, limit):
+        raise NotImplementedError
+
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+
+    def _count(self):
+        raise NotImplementedError
+
+
+    def _is_empty(self):
+        return self._count() == 0
+
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class ShelveStore(FrontierStore):
+    def __init__(self, path, commit_size, commit_interval):
+        self.save = shelve.open(path)
+        self.pending = shelve.open(f"{path}.pending")
+        # dbm files cannot be iterated while being written to, so resume
+        # works from a snapshot of the keys taken on first use.
+        self._pending_keys = None
+        self._urlhash_keys = None
+        super().__init__(path, commit_size, commit_interval)
+
+
+    def _read(self, urlhash):
+        return self.save.get(urlhash)
+
+
+    def _read_pending(self, after, limit):
+        if self._pending_keys is None:
+            self._pending_keys = list(self.pending.keys())
+        start = after or 0
+        chunk = []
+        for urlhash in self._pending_keys[start:start + limit]:
+            entry = self.pending.get(urlhash)
+            if entry is not None:
+                chunk.append((urlhash,) + entry)
+        return chunk, start + limit
+
+
+    def _read_urlhashes(self, after, limit):
+        if self._urlhash_keys is None:
+            self._urlhash_keys = list(self.save.keys())
+        start = after or 0
+        return self._urlhash_keys[start:start + limit], start + limit
+
+
+    def _write(self, batch):
+        for urlhash, (url, completed, priority, depth) in batch.items():
+            self.save[urlhash] = (url, completed)
+            if completed:
+                if urlhash in self.pending:
+                    del self.pending[urlhash]
+            else:
+                self.pending[urlhash] = (url, priority, depth)
+        self.save.sync()
+        self.pending.sync()
+
+
+    def _count(self):
+        return len(self.save)
+
+
+    def _close(self):
+        self.save.close()
+        self.pending.close()
+
+
+class SQLiteStore(FrontierStore):
+    def __init__(self, path, commit_size, commit_interval):
+        # The connection is shared by all workers; every use goes through
+        # store_lock, so sqlite's own thread check is not needed.
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, completed INTEGER NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, priority INTEGER NOT NULL, depth INTEGER NOT NULL)"
+        )
+        super().__init__(path, commit_size, commit_interval)
+
+
+    def _read(self, urlhash):
+        row = self.db.execute(
+            "SELECT url, completed FROM urls WHERE urlhash = ?", (urlhash,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], bool(row[1])
+
+
+    def _read_many(self, urlhashes):
+        found = []
+        # Stay below SQLITE_MAX_VARIABLE_NUMBER on older sqlite builds.
+        for start in range(0, len(urlhashes), 500):
+            chunk = urlhashes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.extend(row[0] for row in self.db.execute(
+                f"SELECT urlhash FROM urls WHERE urlhash IN ({placeholders})", chunk
+            ))
+        return found
+
+
+    def _read_pending(self, after, limit):
+        # Keyset pagination on rowid, so no cursor stays open across commits.
+        rows = self.db.execute(
+            "SELECT rowid, urlhash, url, priority, depth FROM pending WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (after or 0, limit)
+        ).fetchall()
+        if not rows:
+            return [], after
+        return [row[1:] for row in rows], rows[-1][0]
+
+
+    def _read_urlhashes(self, after, limit):
+        rows = self.db.execute(
+            "SELECT rowid, urlhash FROM urls WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (after or 0, limit)
+        ).fetchall()
+        if not rows:
+            return [], after
+        return [row[1] for row in rows], rows[-1][0]
+
+
+    def _write(self, batch):
+        pending_rows = []
+        completed_hashes = []
+        for urlhash, (url, completed, priority, depth) in batch.items():
+            if completed:
+                completed_hashes.append((urlhash,))
+            else:
+                pending_rows.append((urlhash, url, priority, depth))
+        self.db.execute("BEGIN")
+        try:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO urls (urlhash, url, completed) VALUES (?, ?, ?)",
+                [(urlhash, url, int(completed)) for urlhash, (url, completed, _, _) in batch.items()]
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO pending (urlhash, url, priority, depth) VALUES (?, ?, ?, ?)",
+                pending_rows
+            )
+            self.db.executemany("DELETE FROM pending WHERE urlhash = ?", completed_hashes)
+            self.db.execute("COMMIT")
+        except Exception:
+            # Left open, the transaction would make every later BEGIN fail.
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+            raise
+
+
+    def _count(self):
+        return self.db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+
+    def _is_empty(self):
+        return self.db.execute("SELECT 1 FROM urls LIMIT 1").fetchone() is None
+
+
+    def _close(self):
+        self.db.close()
+
+
+STORE_BACKENDS = {
+    "shelve": ShelveStore,
+    "sqlite": SQLiteStore,
+}
+
+
+def open_frontier_store(config):
+    store_class = STORE_BACKENDS[config.store_backend]
+    return store_class(config.save_file, config.commit_batch_size, config.durability_window)
+
+
+def delete_frontier_store(path):
+    # SQLite in WAL mode keeps two sidecar files next to the database, and
+    # the shelve backend keeps its pending index in a second shelve.
+    for file_path in (path, f"{path}-wal", f"{path}-shm", f"{path}.pending"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
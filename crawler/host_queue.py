@@ -0,0 +1,112 @@
+import heapq
+import os
+from hashlib import sha1
+
+
+SEGMENT_SIZE = 256
+
+
+class HostQueue(object):
+    """
+    Urls queued for one host: an in-memory heap of (priority, url), plus
+    on-disk segment files once the frontier's memory budget is used up.
+
+    Once a host has spilled, every new url for it is spilled too. Spilled
+    urls are buffered until `flush`, and every segment keeps the lowest
+    priority in it, so `page_in` brings a segment back as soon as it holds a
+    url that comes before the heap's next one: urls leave the queue in
+    priority order whether they were kept in memory or spilled, and a host
+    usually has at most one paged-in segment, SEGMENT_SIZE urls, on top of
+    the budget.
+    """
+    def __init__(self, host, spill_dir):
+        self.heap = []
+        self.spill_buffer = []
+        # Segment id -> [path, url count, lowest priority], and a heap of
+        # (lowest priority, segment id) that may hold outdated entries.
+        self.segments = {}
+        self.segment_order = []
+        self.open_segment_id = None
+        self.spilled_count = 0
+        self.segment_prefix = os.path.join(spill_dir, sha1(host.encode("utf-8")).hexdigest()[:16])
+        self.next_segment_id = 0
+
+
+    def __len__(self):
+        return len(self.heap) + self.spilled_count
+
+
+    def push(self, priority, url):
+        heapq.heappush(self.heap, (priority, url))
+
+
+    def spill(self, priority, url):
+        self.spill_buffer.append((priority, url))
+        self.spilled_count += 1
+
+
+    def pop(self):
+        return heapq.heappop(self.heap)
+
+
+    def flush(self):
+        """Append buffered spilled urls to the segment files."""
+        buffered = self.spill_buffer
+        self.spill_buffer = []
+        while buffered:
+            segment = self.segments.get(self.open_segment_id)
+            if segment is None or segment[1] >= SEGMENT_SIZE:
+                self.open_segment_id = self.next_segment_id
+                self.next_segment_id += 1
+                segment = self.segments[self.open_segment_id] = [
+                    f"{self.segment_prefix}-{self.open_segment_id}.seg", 0, None]
+            chunk = buffered[:SEGMENT_SIZE - segment[1]]
+            buffered = buffered[len(chunk):]
+            with open(segment[0], "a", encoding="utf-8") as segment_file:
+                segment_file.writelines(f"{priority}\t{url}\n" for priority, url in chunk)
+            segment[1] += len(chunk)
+            lowest = min(priority for priority, _ in chunk)
+            if segment[2] is None or lowest < segment[2]:
+                segment[2] = lowest
+                heapq.heappush(self.segment_order, (lowest, self.open_segment_id))
+
+
+    def page_in(self):
+        """
+        Move spilled urls into the heap, a segment at a time, until the
+        heap's next url comes before every spilled one; return how many.
+        """
+        paged_in = 0
+        while self.spilled_count:
+            if self.segments:
+                self.flush()
+                lowest, segment_id = self._lowest_segment()
+                if self.heap and self.heap[0][0] <= lowest:
+                    break
+                path, _, _ = self.segments.pop(segment_id)
+                with open(path, encoding="utf-8") as segment_file:
+                    entries = [line.rstrip("\n").split("\t", 1) for line in segment_file]
+                os.remove(path)
+                entries = [(int(priority), url) for priority, url in entries]
+            else:
+                if self.heap and self.heap[0][0] <= min(priority for priority, _ in self.spill_buffer):
+                    break
+                entries = self.spill_buffer
+                self.spill_buffer = []
+            for priority, url in entries:
+                heapq.heappush(self.heap, (priority, url))
+            self.spilled_count -= len(entries)
+            paged_in += len(entries)
+        return paged_in
+
+
+    def _lowest_segment(self):
+        # Drops the entries of segments paged in since, or whose lowest
+        # priority has gone down since.
+        order = self.segment_order
+        while True:
+            lowest, segment_id = order[0]
+            segment = self.segments.get(segment_id)
+            if segment is not None and segment[2] == lowest:
+                return lowest, segment_id
+            heapq.heappop(order)
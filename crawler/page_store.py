@@ -0,0 +1,216 @@
+import os
+import sqlite3
+import time
+import traceback
+from threading import Thread, Lock, Event
+
+from crawler.word_counter import WordCounter, BATCH_PAGES
+
+
+SUBDOMAIN_SUFFIX = "ics.uci.edu"
+
+
+def reverse_host(host):
+    """'www.ics.uci.edu' -> 'ude.icu.sci.www', so hosts under a domain share a prefix."""
+    return host[::-1] if host is not None else None
+
+
+class PageWordCounter(WordCounter):
+    """
+    DataStorage.common_words with a PageStore. Pages are counted in
+    WordCounter's per-thread shards as usual, but a full shard is handed to
+    the page store's words table instead of the in-memory counts, so the
+    page store's lock is taken once per batch of pages, and the top words
+    are a query.
+    """
+    def __init__(self, page_store, batch_pages=BATCH_PAGES):
+        super().__init__(batch_pages=batch_pages)
+        self.page_store = page_store
+
+
+    def top(self, n=None):
+        self.flush()
+        return self.page_store.top_words(n)
+
+
+    def vocabulary_size(self):
+        self.flush()
+        return self.page_store.query("SELECT COUNT(*) FROM words")[0][0]
+
+
+    def _merge(self, shard):
+        # Called with shard.lock held.
+        if not shard.counts:
+            return
+        self.page_store.add_words(shard.counts)
+        shard.counts = {}
+        shard.pages = 0
+
+
+class PageStore(object):
+    """
+    One row per crawled page in SQLite (WAL mode), plus a table of word
+    counts over all pages, so that the crawl's reports, and any new
+    question about the crawl, are queries rather than in-memory aggregates.
+
+    Rows and word counts are buffered and written in one transaction by a
+    background thread, once `commit_size` pages are waiting or at the
+    latest every `commit_interval` seconds. Crawler threads only ever touch
+    the buffers; the database is used by the flusher and by report queries,
+    which commit the buffers first. A failed commit is rolled back and its
+    rows and counts go back into the buffers for the next attempt.
+    """
+    def __init__(self, path, commit_size=500, commit_interval=5):
+        self.path = path
+        self.commit_size = commit_size
+        self.commit_interval = commit_interval
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, subdomain TEXT, reversed_host TEXT, status INTEGER, "
+            "word_count INTEGER, byte_size INTEGER, md5 BLOB, simhash BLOB, depth INTEGER, "
+            "latency_ms REAL, fetched_at REAL NOT NULL)"
+        )
+        # Hosts ending in a suffix are a range of reversed hosts, which this
+        # index serves (and covers, for the subdomain report), where a
+        # LIKE '%suffix' on subdomain would scan the table.
+        self.db.execute("CREATE INDEX IF NOT EXISTS pages_reversed_host ON pages (reversed_host, subdomain)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS pages_word_count ON pages (word_count)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS pages_fetched_at ON pages (fetched_at)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS words (word TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS words_count ON words (count)")
+        # db_lock serializes use of the connection, buffer_lock the buffers.
+        self.db_lock = Lock()
+        self.buffer_lock = Lock()
+        self.pending_pages = {}
+        self.pending_words = {}
+        self.words = PageWordCounter(self)
+        self._commit_requested = Event()
+        self._closed = Event()
+        self._flusher = Thread(target=self._commit_periodically, daemon=True)
+        self._flusher.start()
+
+
+    def add_page(self, urlhash, url, subdomain, status, word_count, byte_size, md5, simhash, depth, latency):
+        """Record one crawled page; a page crawled again replaces its row."""
+        row = (urlhash, url, subdomain, reverse_host(subdomain), status, word_count, byte_size, md5,
+               simhash.to_bytes(8, "big") if simhash is not None else None, depth,
+               latency * 1000 if latency is not None else None, time.time())
+        with self.buffer_lock:
+            self.pending_pages[urlhash] = row
+            if len(self.pending_pages) >= self.commit_size:
+                self._commit_requested.set()
+
+
+    def add_words(self, frequencies):
+        """Add a batch of word counts; the page store keeps `frequencies`, which the caller must not reuse."""
+        with self.buffer_lock:
+            pending_words = self.pending_words
+            if not pending_words:
+                self.pending_words = frequencies
+                return
+            for word, count in frequencies.items():
+                pending_words[word] = pending_words.get(word, 0) + count
+
+
+    def commit(self):
+        with self.db_lock:
+            with self.buffer_lock:
+                pages, self.pending_pages = self.pending_pages, {}
+                words, self.pending_words = self.pending_words, {}
+            if not pages and not words:
+                return
+            try:
+                self._write(pages, words)
+            except Exception:
+                with self.buffer_lock:
+                    # Rows added since are newer and win; counts add up.
+                    for urlhash, row in pages.items():
+                        self.pending_pages.setdefault(urlhash, row)
+                    pending_words = self.pending_words
+                    for word, count in words.items():
+                        pending_words[word] = pending_words.get(word, 0) + count
+                raise
+
+
+    def _write(self, pages, words):
+        self.db.execute("BEGIN")
+        try:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO pages (urlhash, url, subdomain, reversed_host, status, word_count, "
+                "byte_size, md5, simhash, depth, latency_ms, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                pages.values()
+            )
+            self.db.executemany(
+                "INSERT INTO words (word, count) VALUES (?, ?) "
+                "ON CONFLICT (word) DO UPDATE SET count = count + excluded.count",
+                words.items()
+            )
+            self.db.execute("COMMIT")
+        except Exception:
+            # Left open, the transaction would make every later BEGIN fail.
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+            raise
+
+
+    def query(self, sql, parameters=()):
+        """Run a read query over everything recorded so far."""
+        self.commit()
+        with self.db_lock:
+            return self.db.execute(sql, parameters).fetchall()
+
+
+    def unique_pages_count(self):
+        return self.query("SELECT COUNT(*) FROM pages")[0][0]
+
+
+    def longest_page(self):
+        rows = self.query("SELECT url, word_count FROM pages WHERE word_count IS NOT NULL "
+                          "ORDER BY word_count DESC, fetched_at LIMIT 1")
+        if not rows:
+            return {"url": None, "word_count": 0}
+        return {"url": rows[0][0], "word_count": rows[0][1]}
+
+
+    def subdomain_counts(self, suffix=SUBDOMAIN_SUFFIX):
+        """Pages per subdomain ending in `suffix`, most crawled first."""
+        prefix = reverse_host(suffix)
+        # Every reversed host starting with prefix, as an index range.
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return dict(self.query(
+            "SELECT subdomain, COUNT(*) AS pages FROM pages WHERE reversed_host >= ? AND reversed_host < ? "
+            "GROUP BY reversed_host ORDER BY pages DESC", (prefix, upper)))
+
+
+    def top_words(self, n=None):
+        return self.query("SELECT word, count FROM words ORDER BY count DESC LIMIT ?",
+                          (n if n is not None else -1,))
+
+
+    def close(self):
+        self._closed.set()
+        self._commit_requested.set()
+        self._flusher.join()
+        self.words.flush()
+        self.commit()
+        with self.db_lock:
+            self.db.close()
+
+
+    def _commit_periodically(self):
+        while not self._closed.is_set():
+            self._commit_requested.wait(self.commit_interval)
+            self._commit_requested.clear()
+            try:
+                self.commit()
+            except Exception:
+                traceback.print_exc()
+
+
+def delete_page_store(path):
+    for file_path in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
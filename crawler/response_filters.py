@@ -0,0 +1,96 @@
+import time
+from threading import Lock
+
+
+# Cost classes, cheapest first. Stages of a cheaper class always run first,
+# so a response rejected by its url or headers never has its body parsed,
+# scanned or hashed. Parsing is a stage of its own, so that its time is not
+# charged to whichever body check happens to read the document first.
+COST_URL = 0
+COST_HEADERS = 1
+COST_PARSE = 2
+COST_BODY_SCAN = 3
+COST_BODY_HASH = 4
+
+
+class FilterStage(object):
+    """
+    One check in a FilterChain. `method` names a method of the object the
+    chain runs on, called as method(url, resp, document) and returning
+    whether the response passes.
+    """
+    def __init__(self, name, cost, method):
+        self.name = name
+        self.cost = cost
+        self.method = method
+
+
+class FilterChain(object):
+    """
+    Runs FilterStages in cost order, stopping at the first rejection, and
+    counts calls, rejections and time spent for every stage, including
+    checks made for a stage outside the chain with check() or record().
+    """
+    def __init__(self, stages):
+        self.stages = sorted(stages, key=lambda stage: stage.cost)
+        self.stats = {
+            stage.name: {"cost": stage.cost, "calls": 0, "rejected": 0, "seconds": 0.0}
+            for stage in self.stages
+        }
+        self.stats_lock = Lock()
+
+
+    def run(self, owner, url, resp, document, min_cost=COST_URL, max_cost=None):
+        """
+        Return True if the response passes every stage, or every stage of
+        cost classes from `min_cost` up to `max_cost`, so a chain can be run
+        in parts, e.g. the checks before and after parsing.
+        """
+        for stage in self.stages:
+            if stage.cost < min_cost or (max_cost is not None and stage.cost > max_cost):
+                continue
+            start = time.perf_counter()
+            passed = getattr(owner, stage.method)(url, resp, document)
+            self.record(stage.name, passed, time.perf_counter() - start)
+            if not passed:
+                return False
+        return True
+
+
+    def check(self, name, passes):
+        """
+        Run `passes()`, a check made for stage `name` outside the chain
+        (e.g. on the url before download), and count it as one of the
+        stage's calls; return whether it passed.
+        """
+        start = time.perf_counter()
+        passed = passes()
+        self.record(name, passed, time.perf_counter() - start)
+        return passed
+
+
+    def record(self, name, passed, seconds):
+        """Count one call of stage `name`, made and timed elsewhere, e.g. in a parse process."""
+        with self.stats_lock:
+            stats = self.stats[name]
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            if not passed:
+                stats["rejected"] += 1
+
+
+    def export(self):
+        with self.stats_lock:
+            return {name: dict(stats) for name, stats in self.stats.items()}
+
+
+    @staticmethod
+    def merge(exports):
+        """Sum the exported stats of several chains, e.g. one per worker."""
+        merged = {}
+        for export in exports:
+            for name, stats in export.items():
+                total = merged.setdefault(name, {"cost": stats["cost"], "calls": 0, "rejected": 0, "seconds": 0.0})
+                for key in ("calls", "rejected", "seconds"):
+                    total[key] += stats[key]
+        return merged
@@ -0,0 +1,203 @@
+import math
+from array import array
+
+
+EMPTY_SLOT = 0
+MAX_LOAD_FACTOR = 0.7
+MAX_STORED_DEPTH = 0xFFFF
+
+
+def url_fingerprint(urlhash):
+    """
+    Fold a hex SHA-256 url hash (see utils.get_urlhash) into a 64-bit int.
+    0 marks an empty slot in SeenIndex, so it is mapped to 1.
+    """
+    return int(urlhash[:16], 16) or 1
+
+
+class BloomFilter(object):
+    """
+    Bit array sized for `capacity` fingerprints at `error_rate` false
+    positives. Positions come from double hashing the two 32-bit halves of
+    the (already uniformly distributed) fingerprint.
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        self.bit_count = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+
+
+    def _positions(self, fingerprint):
+        h1 = fingerprint & 0xFFFFFFFF
+        h2 = (fingerprint >> 32) | 1
+        return [(h1 + i * h2) % self.bit_count for i in range(self.hash_count)]
+
+
+    def add(self, fingerprint):
+        for position in self._positions(fingerprint):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+
+    def __contains__(self, fingerprint):
+        bits = self.bits
+        for position in self._positions(fingerprint):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class SeenIndex(object):
+    """
+    Set of 64-bit url fingerprints with the crawl depth stored inline.
+
+    Fingerprints live in an array('Q') open-addressing table (linear
+    probing, power-of-two size) with a parallel array('H') of depths, about
+    14 bytes per url at the maximum load factor. An optional Bloom filter
+    answers most lookups for unseen urls without touching the table.
+    """
+    def __init__(self, capacity=1 << 16, bloom_capacity=0, bloom_error_rate=0.01):
+        table_size = 1 << max(4, math.ceil(math.log2(capacity / MAX_LOAD_FACTOR)))
+        self.keys = array("Q", bytes(8 * table_size))
+        self.depths = array("H", bytes(2 * table_size))
+        self.mask = table_size - 1
+        self.size = 0
+        self.bloom = BloomFilter(bloom_capacity, bloom_error_rate) if bloom_capacity else None
+
+
+    def __len__(self):
+        return self.size
+
+
+    def __contains__(self, fingerprint):
+        if self.bloom is not None and fingerprint not in self.bloom:
+            return False
+        return self.keys[self._find_slot(fingerprint)] == fingerprint
+
+
+    def get_depth(self, fingerprint, default=None):
+        slot = self._find_slot(fingerprint)
+        if self.keys[slot] != fingerprint:
+            return default
+        return self.depths[slot]
+
+
+    def set_depth(self, fingerprint, depth):
+        slot = self._find_slot(fingerprint)
+        if self.keys[slot] == fingerprint:
+            self.depths[slot] = min(depth, MAX_STORED_DEPTH)
+
+
+    def add(self, fingerprint, depth=0):
+        """Insert a fingerprint; return False if it was already present."""
+        slot = self._find_slot(fingerprint)
+        if self.keys[slot] == fingerprint:
+            return False
+        self.keys[slot] = fingerprint
+        self.depths[slot] = min(depth, MAX_STORED_DEPTH)
+        self.size += 1
+        if self.bloom is not None:
+            self.bloom.add(fingerprint)
+        if self.size > MAX_LOAD_FACTOR * len(self.keys):
+            self._grow()
+        return True
+
+
+    def memory_usage(self):
+        total = self.keys.itemsize * len(self.keys) + self.depths.itemsize * len(self.depths)
+        if self.bloom is not None:
+            total += len(self.bloom.bits)
+        return total
+
+
+    def _find_slot(self, fingerprint):
+        keys = self.keys
+        mask = self.mask
+        slot = fingerprint & mask
+        while True:
+            key = keys[slot]
+            if key == fingerprint or key == EMPTY_SLOT:
+                return slot
+            slot = (slot + 1) & mask
+
+
+    def _grow(self):
+        old_keys, old_depths = self.keys, self.depths
+        table_size = 2 * len(old_keys)
+        self.keys = array("Q", bytes(8 * table_size))
+        self.depths = array("H", bytes(2 * table_size))
+        self.mask = table_size - 1
+        for key, depth in zip(old_keys, old_depths):
+            if key != EMPTY_SLOT:
+                slot = self._find_slot(key)
+                self.keys[slot] = key
+                self.depths[slot] = depth
+
+
+class DigestIndex(object):
+    """
+    Set of 128-bit digests, such as md5s, held as two 64-bit halves in
+    parallel array('Q') open-addressing tables (linear probing on the first
+    half), about 23 bytes per digest at the maximum load factor. Both
+    halves are compared, so digests sharing a prefix stay distinct. The
+    all-zero digest marks an empty slot and cannot be stored.
+    """
+    def __init__(self, capacity=1 << 16):
+        table_size = 1 << max(4, math.ceil(math.log2(capacity / MAX_LOAD_FACTOR)))
+        self.heads = array("Q", bytes(8 * table_size))
+        self.tails = array("Q", bytes(8 * table_size))
+        self.mask = table_size - 1
+        self.size = 0
+
+
+    def __len__(self):
+        return self.size
+
+
+    def __contains__(self, halves):
+        head, tail = halves
+        slot = self._find_slot(head, tail)
+        return self.heads[slot] == head and self.tails[slot] == tail
+
+
+    def add(self, head, tail):
+        """Insert the digest with halves `head` and `tail`; return False if it was already present."""
+        slot = self._find_slot(head, tail)
+        if self.heads[slot] == head and self.tails[slot] == tail:
+            return False
+        self.heads[slot] = head
+        self.tails[slot] = tail
+        self.size += 1
+        if self.size > MAX_LOAD_FACTOR * len(self.heads):
+            self._grow()
+        return True
+
+
+    def memory_usage(self):
+        return self.heads.itemsize * len(self.heads) + self.tails.itemsize * len(self.tails)
+
+
+    def _find_slot(self, head, tail):
+        heads = self.heads
+        tails = self.tails
+        mask = self.mask
+        slot = head & mask
+        while True:
+            slot_head = heads[slot]
+            if slot_head == head and tails[slot] == tail:
+                return slot
+            if slot_head == EMPTY_SLOT and tails[slot] == EMPTY_SLOT:
+                return slot
+            slot = (slot + 1) & mask
+
+
+    def _grow(self):
+        old_heads, old_tails = self.heads, self.tails
+        table_size = 2 * len(old_heads)
+        self.heads = array("Q", bytes(8 * table_size))
+        self.tails = array("Q", bytes(8 * table_size))
+        self.mask = table_size - 1
+        for head, tail in zip(old_heads, old_tails):
+            if head != EMPTY_SLOT or tail != EMPTY_SLOT:
+                slot = self._find_slot(head, tail)
+                self.heads[slot] = head
+                self.tails[slot] = tail
@@ -0,0 +1,102 @@
+from array import array
+
+
+FINGERPRINT_BITS = 64
+DEFAULT_BUCKET_BITS = 16
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(value):
+        return bin(value).count("1")
+
+
+def block_keys(max_distance, bucket_bits=DEFAULT_BUCKET_BITS):
+    """
+    (shift, mask) of the bucket key of each of the max_distance + 1 blocks
+    a fingerprint is cut into: the top `bucket_bits` bits of the block.
+    """
+    block_count = max_distance + 1
+    bounds = [round(i * FINGERPRINT_BITS / block_count) for i in range(block_count + 1)]
+    keys = []
+    for low, high in zip(bounds, bounds[1:]):
+        key_bits = min(high - low, bucket_bits)
+        keys.append((high - key_bits, (1 << key_bits) - 1))
+    return keys
+
+
+class SimhashIndex(object):
+    """
+    Set of 64-bit simhash fingerprints answering "is any stored fingerprint
+    within Hamming distance `max_distance` of this one?".
+
+    Uses the block-partitioned (permuted table) method: fingerprints are cut
+    into max_distance + 1 blocks, and two fingerprints at most max_distance
+    bits apart must agree on at least one whole block. There is one table
+    per block, keyed by (the top `bucket_bits` bits of) that block, so a
+    query only compares against the fingerprints sharing a block with it.
+    Buckets are array('Q'), 8 bytes per fingerprint per table, created on
+    first use.
+
+    With the default 16-bit keys a query at 10M fingerprints scans about
+    150 candidates per table. Larger distances mean shorter blocks and
+    larger buckets; distances above 4 get slow at that size.
+
+    Not thread safe; DataStorage guards it with simhash_index_lock.
+    """
+    def __init__(self, max_distance=3, bucket_bits=DEFAULT_BUCKET_BITS):
+        assert 0 <= max_distance < FINGERPRINT_BITS, "max_distance should be between 0 and 63"
+        self.max_distance = max_distance
+        self.keys = block_keys(max_distance, bucket_bits)
+        self.tables = [[None] * (mask + 1) for _, mask in self.keys]
+        self.count = 0
+
+
+    def __len__(self):
+        return self.count
+
+
+    def find(self, fingerprint):
+        """Return a stored fingerprint within max_distance of `fingerprint`, or None."""
+        max_distance = self.max_distance
+        for table, (shift, mask) in zip(self.tables, self.keys):
+            bucket = table[(fingerprint >> shift) & mask]
+            if bucket is None:
+                continue
+            for candidate in bucket:
+                if popcount(candidate ^ fingerprint) <= max_distance:
+                    return candidate
+        return None
+
+
+    def __contains__(self, fingerprint):
+        return self.find(fingerprint) is not None
+
+
+    def add(self, fingerprint):
+        for table, (shift, mask) in zip(self.tables, self.keys):
+            key = (fingerprint >> shift) & mask
+            bucket = table[key]
+            if bucket is None:
+                bucket = table[key] = array("Q")
+            bucket.append(fingerprint)
+        self.count += 1
+
+
+    def add_if_new(self, fingerprint):
+        """Add `fingerprint` unless it is a near duplicate; return whether it was added."""
+        if self.find(fingerprint) is not None:
+            return False
+        self.add(fingerprint)
+        return True
+
+
+    def memory_usage(self):
+        """Approximate bytes held by the tables and buckets."""
+        total = 0
+        for table in self.tables:
+            total += 8 * len(table)
+            for bucket in table:
+                if bucket is not None:
+                    total += 64 + bucket.buffer_info()[1] * bucket.itemsize
+        return total
@@ -0,0 +1,143 @@
+import re
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qsl
+
+
+DIGITS_REGEX = re.compile(r"\d+")
+HASH_REGEX = re.compile(
+    r"^(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|(?=.*\d)(?=.*[a-f])[0-9a-f]{8,})$", re.IGNORECASE)
+THROTTLE_PRIORITY_PENALTY = 10 ** 9
+# Trap pages tend to differ from each other only in numbers, dates or links,
+# which the crawler's md5 and simhash checks on the raw html miss; so each
+# page is also compared with the visible text of the template's most recent
+# distinct pages, up to this many.
+MAX_TEXTS_PER_TEMPLATE = 64
+MAX_TEMPLATES = 50000
+
+
+def segment_template(segment):
+    if HASH_REGEX.match(segment):
+        return "<h>"
+    return DIGITS_REGEX.sub("<n>", segment)
+
+
+def url_template(url):
+    """
+    Map a url to its host's path/query template: hash-like segments become
+    <h> (and everything after one in the path is collapsed, as in commit or
+    tree urls), digit runs become <n>, and query parameters are sorted.
+    """
+    parsed = urlparse(url)
+    segments = []
+    for segment in parsed.path.split("/"):
+        segment = segment_template(segment)
+        segments.append(segment)
+        if segment == "<h>":
+            segments.append("*")
+            break
+    query = "&".join(sorted(
+        f"{name}={segment_template(value)}" for name, value in parse_qsl(parsed.query, keep_blank_values=True)))
+    return f"{parsed.netloc.lower()}{'/'.join(segments)}?{query}"
+
+
+class TemplateStats(object):
+    __slots__ = ("discovered", "fetched", "unique", "content_yield", "banned", "texts")
+
+    def __init__(self):
+        self.discovered = 0
+        self.fetched = 0
+        self.unique = 0
+        # Moving average of recent fetches being unique, so that a template
+        # that was useful at first and then turns into a trap is caught.
+        self.content_yield = 1.0
+        self.banned = False
+        # Text fingerprints, oldest first (a dict used as an ordered set).
+        self.texts = {}
+
+
+class TrapDetector(object):
+    """
+    Online crawler-trap detection by url template.
+
+    Every discovered url is grouped under its url_template, and every page
+    that reaches deduplication is recorded as unique or duplicate content
+    for its template, averaged over roughly its last `min_samples` fetches;
+    a page repeating the text fingerprint of an earlier page of its template
+    counts as a duplicate too. Once a template has `min_samples` fetches, a
+    unique content yield under `throttle_yield` pushes its urls behind the rest of
+    their host's queue, and a yield under `ban_yield` bans it: its queued
+    and future urls are dropped without being fetched.
+
+    Statistics are kept for at most `max_templates` templates, least
+    recently seen evicted first, so templates of hosts the crawl has moved
+    on from do not pile up; banned templates are remembered apart and never
+    evicted.
+
+    Not thread safe; the Frontier calls it under its lock. Statistics are
+    kept in memory only, so a resumed crawl learns them again.
+    """
+    def __init__(self, min_samples=20, ban_yield=0.2, throttle_yield=0.5, logger=None,
+                 max_templates=MAX_TEMPLATES):
+        self.min_samples = min_samples
+        self.ban_yield = ban_yield
+        self.throttle_yield = throttle_yield
+        self.logger = logger
+        self.max_templates = max_templates
+        self.templates = OrderedDict()
+        self.banned = set()
+        self.smoothing = 2 / (min_samples + 1)
+
+
+    def stats(self, url):
+        template = url_template(url)
+        stats = self.templates.get(template)
+        if stats is None:
+            stats = self.templates[template] = TemplateStats()
+            stats.banned = template in self.banned
+            if len(self.templates) > self.max_templates:
+                self.templates.popitem(last=False)
+        else:
+            self.templates.move_to_end(template)
+        return template, stats
+
+
+    def discovered(self, url):
+        """Count a newly discovered url; return its priority penalty, or None if banned."""
+        _, stats = self.stats(url)
+        if stats.banned:
+            return None
+        stats.discovered += 1
+        if stats.fetched >= self.min_samples and stats.content_yield < self.throttle_yield:
+            return THROTTLE_PRIORITY_PENALTY
+        return 0
+
+
+    def is_banned(self, url):
+        return url_template(url) in self.banned
+
+
+    def record(self, url, unique, text_fingerprint=None):
+        """Record whether the page fetched from `url` had unique content."""
+        template, stats = self.stats(url)
+        if unique and text_fingerprint is not None:
+            texts = stats.texts
+            if text_fingerprint in texts:
+                unique = False
+            else:
+                texts[text_fingerprint] = None
+                if len(texts) > MAX_TEXTS_PER_TEMPLATE:
+                    del texts[next(iter(texts))]
+        stats.fetched += 1
+        stats.unique += bool(unique)
+        stats.content_yield += self.smoothing * (bool(unique) - stats.content_yield)
+        if not stats.banned and stats.fetched >= self.min_samples and stats.content_yield < self.ban_yield:
+            stats.banned = True
+            self.banned.add(template)
+            if self.logger:
+                self.logger.info(
+                    f"Banned url template {template}: {stats.unique} unique pages in {stats.fetched} "
+                    f"fetches ({stats.content_yield:.0%} recently), {stats.discovered} urls discovered.")
+
+
+    def banned_templates(self):
+        return list(self.banned)
@@ -0,0 +1,160 @@
+import threading
+from array import array
+
+
+BATCH_PAGES = 32
+
+
+class CountMinSketch(object):
+    """
+    Approximate counts in `depth` rows of `width` counters: a word's count
+    is never underestimated, and overestimated by at most about
+    e / width of all words counted with probability 1 - exp(-depth).
+    Memory is fixed however large the vocabulary grows.
+
+    Updates are conservative: only the counters below the word's new
+    estimate are raised, which keeps overestimates well under that bound.
+    """
+    def __init__(self, width, depth=4):
+        self.width = width
+        self.depth = depth
+        self.counters = array("Q", bytes(8 * width * depth))
+
+
+    def _positions(self, word):
+        # Double hashing on the two halves of the (per process salted) str hash.
+        value = hash(word)
+        h1 = value & 0xFFFFFFFF
+        h2 = ((value >> 32) & 0xFFFFFFFF) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+
+    def add(self, word, count):
+        """Add `count` occurrences of `word` and return its new estimate."""
+        counters = self.counters
+        positions = self._positions(word)
+        estimate = min([counters[position] for position in positions]) + count
+        for position in positions:
+            if counters[position] < estimate:
+                counters[position] = estimate
+        return estimate
+
+
+    def __getitem__(self, word):
+        counters = self.counters
+        return min([counters[position] for position in self._positions(word)])
+
+
+    def memory_usage(self):
+        return self.counters.itemsize * len(self.counters)
+
+
+class WordCountShard(object):
+    __slots__ = ("counts", "pages", "lock")
+
+    def __init__(self):
+        self.counts = {}
+        self.pages = 0
+        self.lock = threading.Lock()
+
+
+class WordCounter(object):
+    """
+    Crawl-wide word frequencies with the `top_k` most common words kept up
+    to date as counts come in.
+
+    Each thread adds pages to its own shard, which is merged into the
+    global counts once it holds `batch_pages` pages (or on flush), so the
+    global lock is taken once per batch rather than once per page. Counts
+    only grow, so after a merge the top words can only be the previous top
+    words or words the batch touched; the top table is updated from those
+    alone and never needs a sort of the vocabulary.
+
+    With `sketch_width`, global counts are kept in a CountMinSketch instead
+    of a dict, which caps memory on very long crawls at the price of
+    slightly overestimated counts; only the top words are stored by name.
+    """
+    def __init__(self, top_k=50, batch_pages=BATCH_PAGES, sketch_width=0, sketch_depth=4):
+        self.top_k = top_k
+        self.batch_pages = batch_pages
+        self.counts = {}
+        self.sketch = CountMinSketch(sketch_width, sketch_depth) if sketch_width else None
+        # word -> count of the current top_k words, and the smallest of those counts.
+        self.top_words = {}
+        self.top_floor = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards = []
+
+
+    def add(self, frequencies):
+        """Count one page's word frequencies."""
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = WordCountShard()
+            with self.lock:
+                self.shards.append(shard)
+        with shard.lock:
+            counts = shard.counts
+            for word, count in frequencies.items():
+                counts[word] = counts.get(word, 0) + count
+            shard.pages += 1
+            if shard.pages >= self.batch_pages:
+                self._merge(shard)
+
+
+    def flush(self):
+        """Merge every thread's pending counts into the global ones."""
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            with shard.lock:
+                self._merge(shard)
+
+
+    def top(self, n=None):
+        """The top words as (word, count) pairs, most common first."""
+        self.flush()
+        with self.lock:
+            ranked = sorted(self.top_words.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:n] if n is not None else ranked
+
+
+    def vocabulary_size(self):
+        """Distinct words counted, or None when counting in a sketch."""
+        with self.lock:
+            return len(self.counts) if self.sketch is None else None
+
+
+    def _merge(self, shard):
+        # Called with shard.lock held.
+        if not shard.counts:
+            return
+        with self.lock:
+            counts = self.counts
+            sketch = self.sketch
+            top_words = self.top_words
+            for word, count in shard.counts.items():
+                if sketch is not None:
+                    total = sketch.add(word, count)
+                else:
+                    total = counts[word] = counts.get(word, 0) + count
+                if total > self.top_floor or word in top_words:
+                    self._offer(word, total)
+        shard.counts = {}
+        shard.pages = 0
+
+
+    def _offer(self, word, total):
+        top_words = self.top_words
+        if word in top_words or len(top_words) < self.top_k:
+            top_words[word] = total
+        elif total > self.top_floor:
+            # Ties keep the word that got there first.
+            del top_words[min(top_words, key=top_words.get)]
+            top_words[word] = total
+        else:
+            return
+        if len(top_words) == self.top_k:
+            self.top_floor = min(top_words.values())
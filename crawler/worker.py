@@ -1,26 +1,24 @@
-import asyncio
-import hashlib
 import mimetypes
-import pdb
-import re
-import threading
 import traceback
-from collections import Counter
-from datetime import datetime, date
+from datetime import date
 from threading import Thread
-from inspect import getsource
-from utils.download import download
+from utils.download import download, DOWNLOAD_ABORTED_STATUS
+from utils.parsed_document import ParsedDocument, DATE_REGEX
+from utils.parse_pool import get_parse_pool
+from utils.link_extractor import get_link_extractor
+from utils.url_filter import UrlFilter
+from crawler.response_filters import (
+    FilterChain, FilterStage, COST_URL, COST_HEADERS, COST_PARSE, COST_BODY_SCAN, COST_BODY_HASH)
 from utils import get_logger
 from urllib.parse import urlparse, parse_qs, urldefrag
 import scraper
 import time
-from simhash import Simhash
 
 
 MAX_FILE_SIZE = 1024 * 1024 * 10
+FRONTIER_POLL_TIMEOUT = 1
 MIN_DATE = date(1968, 1, 1)
 MAX_DATE = date(2023, 11, 3)
-DATE_REGEX = re.compile(r'\b\d{4}-\d{1,2}-\d{1,2}\b')
 DATE_FORMATES = [
     "%Y-%m-%d",  # ISO 8601 format
     "%d-%m-%Y",  # Day-Month-Year format
@@ -57,46 +55,76 @@ def update_subdomain(url, subdomains):
 
 
 class Worker(Thread):
-    def __init__(self, worker_id, config, frontier, data_storage, next_permission_request_time, stop_flag):
+    # Checks every downloaded page goes through before it is scraped. The
+    # chain runs them by cost class, so url and header checks come before
+    # anything that reads the body.
+    response_filters = [
+        FilterStage("url_pattern", COST_URL, "check_url_pattern"),
+        FilterStage("file_size", COST_HEADERS, "check_file_size"),
+        FilterStage("file_type", COST_HEADERS, "check_file_type"),
+        FilterStage("parse", COST_PARSE, "parse_document"),
+        FilterStage("date_range", COST_BODY_SCAN, "check_valid_date_range"),
+        FilterStage("duplicate", COST_BODY_HASH, "check_duplicate_content"),
+    ]
+
+    def __init__(self, worker_id, config, frontier, data_storage, stop_flag):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
         self.data_storage = data_storage
-        self.next_permission_request_time = next_permission_request_time
         self._stop_flag = stop_flag
-        self.domain_delay_lock = threading.Lock()
+        self.link_extractor = get_link_extractor(config.link_extractor)
+        self.url_filter = UrlFilter(config.allowed_domains)
+        self.filter_chain = FilterChain(self.response_filters)
+        self.parse_pool = get_parse_pool(config)
+        # Called on the parse pool's consumer thread after each of this
+        # worker's pages it handled; the asyncio engine wakes its loop with it.
+        self.on_pooled_page_done = None
         super().__init__(daemon=True)
 
 
     def run(self):
         while not self._stop_flag.is_set():
-            tbd_url = self.frontier.get_tbd_url()
+            # The frontier only hands out urls whose host is past its
+            # politeness delay, so no sleeping is needed here.
+            tbd_url = self.frontier.get_tbd_url(timeout=FRONTIER_POLL_TIMEOUT)
             if not tbd_url:
-                self.logger.info("Frontier is empty. Stopping Crawler.")
-                break
-            self.process_url(tbd_url)
-            time.sleep(self.config.time_delay)
+                if self.is_crawl_done():
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+                continue
+            try:
+                self.process_url(tbd_url)
+            finally:
+                self.frontier.release_host(tbd_url)
 
 
     def stop(self):
         self._stop_flag.set()
 
 
+    def is_crawl_done(self):
+        """True once the frontier is exhausted and no page left in the parse pool can refill it."""
+        if self.parse_pool is None:
+            return self.frontier.is_exhausted()
+        # A pooled page adds its links before it counts as finished, so an
+        # exhausted frontier means the crawl is over only if no page was in
+        # the pool, or got in or out of it, while the frontier was checked.
+        progress = self.parse_pool.progress()
+        submitted, finished = progress
+        return (submitted == finished and self.frontier.is_exhausted()
+                and self.parse_pool.progress() == progress)
+
+
     def process_url(self, tbd_url):
         try:
-            domain = urlparse(tbd_url).netloc
-            self.apply_domain_delay(domain)
-            resp = download(tbd_url, self.config, self.logger)
-            self.update_domain_delay(domain)
+            if not self.check_url_before_download(tbd_url):
+                return
+            start = time.perf_counter()
+            resp = download(tbd_url, self.config, self.logger, max_size=MAX_FILE_SIZE)
+            latency = time.perf_counter() - start
             if resp:
-                with self.data_storage.visited_url_lock:
-                    url_without_fragment, fragment = urldefrag(tbd_url)
-                    self.data_storage.visited_url.add(url_without_fragment)
-
-                with self.data_storage.subdomains_lock:
-                    update_subdomain(tbd_url, self.data_storage.subdomains)
-
-                self.handle_response(tbd_url, resp)
+                self.process_response(tbd_url, resp, latency)
             else:
                 self.logger.error(f"Failed to download {tbd_url}.")
         except Exception as e:
@@ -105,74 +133,123 @@ class Worker(Thread):
             pass
 
 
-    def handle_response(self, tbd_url, resp):
+    def process_response(self, tbd_url, resp, latency=None):
+        if self.data_storage.page_store is None:
+            with self.data_storage.visited_url_lock:
+                url_without_fragment, fragment = urldefrag(tbd_url)
+                self.data_storage.visited_url.add(url_without_fragment)
+
+            with self.data_storage.subdomains_lock:
+                update_subdomain(tbd_url, self.data_storage.subdomains)
+
+        self.handle_response(tbd_url, resp, latency)
+
+
+    def record_page(self, tbd_url, resp, document, latency):
+        """
+        Add the page's row to the page store, if there is one, under the url
+        it was fetched from after redirects; `document` is None unless it
+        was scraped.
+        """
+        if self.data_storage.page_store is None:
+            return
+        raw_response = resp.raw_response
+        byte_size = len(raw_response.content) if raw_response is not None and raw_response.content is not None else None
+        word_count = md5 = simhash = None
+        if document is not None:
+            if 200 <= resp.status < 400:
+                # Only pages the scraper counted words for, as for the longest page.
+                word_count = sum(document.word_frequencies.values())
+            md5 = document.md5
+            simhash = self.hash_content_by_simhash(document)
+        self.data_storage.add_page(
+            resp.url or tbd_url, resp.status, byte_size, word_count, md5, simhash,
+            self.frontier.get_url_depth(tbd_url), latency)
+
+
+    def handle_response(self, tbd_url, resp, latency=None):
+        """
+        Check, scrape and record a downloaded page. With a parse pool, a page
+        whose url and headers pass is handed to the pool, and the rest runs
+        on the pool's consumer thread once it is parsed, while this thread
+        goes on fetching.
+        """
+        fetched_url = tbd_url
+        if resp.status == DOWNLOAD_ABORTED_STATUS:
+            self.logger.info(f"Aborted download of {tbd_url}: {resp.error}")
+            self.frontier.mark_url_complete(tbd_url)
+            self.record_page(fetched_url, resp, None, latency)
+            return
         if resp.raw_response is None:
             self.logger.error(f"No raw response for URL {tbd_url}")
+            self.record_page(fetched_url, resp, None, latency)
             return
         if tbd_url != resp.url:
             self.logger.info(f"Redirected from {tbd_url} to {resp.url}")
             self.frontier.mark_url_complete(tbd_url)
             tbd_url = resp.url
-        if not self.check_duplicate_content(tbd_url, resp.raw_response.content):
-            return
-        if not self.check_file_size(tbd_url, resp.raw_response.headers, resp.raw_response.content):
+        if self.parse_pool is None:
+            # Decoded and parsed at most once, by the chain's parse stage.
+            document = ParsedDocument(tbd_url, resp.raw_response.content, self.link_extractor)
+            self.scrape_response(fetched_url, tbd_url, resp, document, latency)
             return
-        if not self.check_file_type_and_url_pattern(tbd_url, resp.raw_response.headers):
+        if not self.filter_chain.run(self, tbd_url, resp, None, max_cost=COST_HEADERS):
+            self.record_page(fetched_url, resp, None, latency)
             return
-        if not self.check_valid_date_range(tbd_url, resp.raw_response.content):
-            return
-
-        self.logger.info(
-            f"Downloaded {tbd_url}, status <{resp.status}>, "
-            f"using cache {self.config.cache_server}."
-        )
-        self.process_scraped_urls(tbd_url, resp)
+        self.parse_pool.submit(
+            tbd_url, resp.raw_response.content,
+            lambda document, seconds: self.scrape_parsed(fetched_url, tbd_url, resp, document, seconds, latency))
 
 
-    def process_scraped_urls(self, tbd_url, resp):
-        scraped_urls = scraper.scraper(tbd_url, resp, self.data_storage)
-        for scraped_url in scraped_urls:
-            self.frontier.add_url(scraped_url, parent_url=tbd_url)
-        self.frontier.mark_url_complete(tbd_url)
+    def scrape_response(self, fetched_url, tbd_url, resp, document, latency, min_cost=COST_URL):
+        """Scrape the page if it passes the chain's stages from `min_cost` on, and record it."""
+        if self.filter_chain.run(self, tbd_url, resp, document, min_cost):
+            self.logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server}."
+            )
+            self.process_scraped_urls(tbd_url, resp, document)
+        else:
+            document = None
+        self.record_page(fetched_url, resp, document, latency)
 
 
-    def apply_domain_delay(self, domain):
-        with self.domain_delay_lock:
-            now = time.time()
-            if domain in self.next_permission_request_time:
-                delay = self.next_permission_request_time[domain] - now
-                if delay > 0:
-                    time.sleep(delay)
+    def scrape_parsed(self, fetched_url, tbd_url, resp, document, seconds, latency):
+        # Runs on the parse pool's consumer thread, for a page that passed
+        # the url and header checks before it was submitted.
+        try:
+            self.filter_chain.record("parse", True, seconds)
+            self.scrape_response(fetched_url, tbd_url, resp, document, latency, min_cost=COST_BODY_SCAN)
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"An error occurred while processing URL {tbd_url}: {str(e)}")
+        finally:
+            if self.on_pooled_page_done is not None:
+                self.on_pooled_page_done()
 
 
-    def update_domain_delay(self, domain):
-        with self.domain_delay_lock:
-            minimum_delay = 0.5
-            self.next_permission_request_time[domain] = max(
-                time.time() + self.config.time_delay,
-                self.next_permission_request_time.get(domain, 0) + minimum_delay
-            )
+    def process_scraped_urls(self, tbd_url, resp, document=None):
+        scraped_urls = scraper.scraper(tbd_url, resp, self.data_storage, document, self.url_filter)
+        self.frontier.add_urls(scraped_urls, parent_url=tbd_url)
+        self.frontier.mark_url_complete(tbd_url)
 
 
-    def check_duplicate_content(self, tbd_url, content):
+    def check_duplicate_content(self, tbd_url, resp, document):
         try:
-            md5_content = self.hash_content_by_md5(content)
-            with self.data_storage.md5_set_lock:
-                if md5_content in self.data_storage.md5_set:
-                    self.logger.info(f"Duplicate content found for URL {tbd_url}")
-                    self.frontier.mark_url_complete(tbd_url)
-                    return False
-                else:
-                    self.data_storage.md5_set.add(md5_content)
-
-            simhash_content = self.hash_content_by_simhash(content)
-            with self.data_storage.simhash_set_lock:
-                if simhash_content in self.data_storage.simhash_set:
-                    self.logger.info(f"Similar content found for URL {tbd_url}")
-                    self.frontier.mark_url_complete(tbd_url)
-                    return False
-                else:
-                    self.data_storage.simhash_set.add(simhash_content)
+            md5_content = document.md5
+            if not self.data_storage.add_content_md5(md5_content):
+                self.logger.info(f"Duplicate content found for URL {tbd_url}")
+                self.frontier.record_content(tbd_url, False)
+                self.frontier.mark_url_complete(tbd_url)
+                return False
+
+            simhash_content = self.hash_content_by_simhash(document)
+            if simhash_content is not None and not self.data_storage.add_content_simhash(simhash_content):
+                self.logger.info(f"Similar content found for URL {tbd_url}")
+                self.frontier.record_content(tbd_url, False)
+                self.frontier.mark_url_complete(tbd_url)
+                return False
+            self.frontier.record_content(tbd_url, True, document.text_fingerprint)
             return True
         except Exception as e:
             traceback.print_exc()
@@ -180,9 +257,9 @@ class Worker(Thread):
             pass
 
 
-    def check_file_size(self, tbd_url, headers, content):
+    def check_file_size(self, tbd_url, resp, document):
         try:
-            if self.is_large_file(headers, content):
+            if self.is_large_file(resp.raw_response.headers, resp.raw_response.content):
                 self.logger.info(f"Content is too large for URL {tbd_url}")
                 self.frontier.mark_url_complete(tbd_url)
                 return False
@@ -193,31 +270,45 @@ class Worker(Thread):
             pass
 
 
-    def check_file_type_and_url_pattern(self, tbd_url, headers):
-        if self.is_unwanted_file_type(tbd_url, headers) or self.is_unwanted_url_pattern(tbd_url):
-            self.logger.info(f"Unwanted content found for URL {tbd_url}")
+    def check_url_before_download(self, tbd_url):
+        # Without headers, is_unwanted_file_type guesses the type from the
+        # url. Both checks count as calls of their stages in the chain.
+        if (not self.filter_chain.check("file_type", lambda: not self.is_unwanted_file_type(tbd_url, {}))
+                or not self.filter_chain.check("url_pattern", lambda: not self.is_unwanted_url_pattern(tbd_url))):
+            self.logger.info(f"Unwanted url {tbd_url}, not downloading it.")
             self.frontier.mark_url_complete(tbd_url)
             return False
         return True
 
 
-    @staticmethod
-    def hash_content_by_md5(content):
-        return hashlib.md5(content).hexdigest()
+    def parse_document(self, tbd_url, resp, document):
+        # Not a check: decodes and parses the page for the checks after it.
+        document.parse()
+        return True
 
 
-    @staticmethod
-    def hash_content_by_simhash(content):
-        try:
-            # Step 1: Convert bytes to string
-            text = content.decode('utf-8', errors='ignore')
+    def check_url_pattern(self, tbd_url, resp, document):
+        # Repeated after redirects, which can land on an unwanted url.
+        if self.is_unwanted_url_pattern(tbd_url):
+            self.logger.info(f"Unwanted url pattern for URL {tbd_url}")
+            self.frontier.mark_url_complete(tbd_url)
+            return False
+        return True
+
+
+    def check_file_type(self, tbd_url, resp, document):
+        if self.is_unwanted_file_type(tbd_url, resp.raw_response.headers):
+            self.logger.info(f"Unwanted content found for URL {tbd_url}")
+            self.frontier.mark_url_complete(tbd_url)
+            return False
+        return True
 
-            # Step 2: Tokenize the text and count word occurrences
-            words = re.findall(r'\w+', text)
-            word_counts = Counter(words)
 
-            # Step 3: Create and return the Simhash object
-            return Simhash(word_counts).value
+    @staticmethod
+    def hash_content_by_simhash(document):
+        try:
+            # The visible text's word frequencies, counted once per document.
+            return document.content_simhash
         except Exception as e:
             traceback.print_exc()
             print(f"An error occurred: {str(e)}")
@@ -259,10 +350,11 @@ class Worker(Thread):
         return False
 
 
-    def check_valid_date_range(self, url, content):
+    def check_valid_date_range(self, url, resp, document):
         try:
-            content = content.decode('utf-8', errors='ignore')
-            dates = DATE_REGEX.findall(url + content)
+            # Each distinct date is parsed once, however often the page repeats it.
+            dates = set(DATE_REGEX.findall(url))
+            dates.update(document.dates)
             if not dates:
                 self.logger.info(f"No dates found for URL {url}.")
                 return True
@@ -291,10 +383,10 @@ class Worker(Thread):
 
 
     def parse_date(self, date_str):
-        for date_format in DATE_FORMATES:
-            try:
-                return datetime.strptime(date_str, date_format).date()
-            except ValueError:
-                continue  # Try the next format
-
-        raise ValueError(f"Date format is incorrect for {date_str}. Tried formats: {DATE_FORMATES}")
+        # DATE_REGEX only matches year-first dates, and of DATE_FORMATES only
+        # "%Y-%m-%d" can parse those, so the fields are read directly.
+        try:
+            year, month, day = (int(part) for part in date_str.split("-"))
+            return date(year, month, day)
+        except ValueError:
+            raise ValueError(f"Date format is incorrect for {date_str}. Tried formats: {DATE_FORMATES}")
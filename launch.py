@@ -18,7 +18,8 @@ def main(config_file, restart):
         cparser = ConfigParser()
         cparser.read(config_file)
         config = Config(cparser)
-        config.cache_server = get_cache_server(config, restart)
+        if config.response_cache_mode != "replay":
+            config.cache_server = get_cache_server(config, restart)
         crawler = Crawler(config, restart)
         signal.signal(signal.SIGTERM, lambda signum, frame: sigterm_handler(signum, frame, crawler))
         crawler.start()
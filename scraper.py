@@ -1,16 +1,14 @@
-from urllib.parse import urlparse, urldefrag, parse_qsl, urlunparse, urlencode, urljoin
-
-from bs4 import BeautifulSoup
+from urllib.parse import urlparse, parse_qsl, urlunparse, urlencode
 
+from utils.parsed_document import ParsedDocument
 from utils.text_processor import *
-
-import pdb
+from utils.url_filter import UrlFilter
 
 
-MAX_URL_LENGTH = 200
+DEFAULT_URL_FILTER = UrlFilter()
 
 
-def scraper(url, resp, data_storage) -> list:
+def scraper(url, resp, data_storage, document=None, url_filter=None) -> list:
     try:
         if resp is None:
             return []
@@ -19,15 +17,18 @@ def scraper(url, resp, data_storage) -> list:
         if resp.status < 200 or resp.status >= 400:
             return []
 
-        words_freq = extract_curr_content(resp)
-        raw_sub_links = extract_next_links(url, resp)
-        valid_sub_links = [link for link in raw_sub_links if (is_valid(link, data_storage))]
+        # The worker passes the document its own checks already parsed.
+        if document is None:
+            document = ParsedDocument(url, resp.raw_response.content)
+        words_freq = extract_curr_content(resp, document)
+        raw_sub_links = extract_next_links(url, resp, document)
+        valid_sub_links = (url_filter or DEFAULT_URL_FILTER).filter_urls(raw_sub_links, data_storage)
 
         with data_storage.longest_page_lock:
             update_longest_page(url, words_freq, data_storage.longest_page)
 
-        with data_storage.common_words_lock:
-            update_common_words(words_freq, data_storage.common_words)
+        # Counted in this thread's shard; see crawler/word_counter.py.
+        update_common_words(words_freq, data_storage.common_words)
 
         return valid_sub_links
 
@@ -37,7 +38,7 @@ def scraper(url, resp, data_storage) -> list:
         return []
 
 
-def extract_next_links(url, resp):
+def extract_next_links(url, resp, document=None):
     # Implementation required.
     # url: the URL that was used to get the page
     # resp.url: the actual url of the page
@@ -47,70 +48,22 @@ def extract_next_links(url, resp):
     #         resp.raw_response.url: the url, again
     #         resp.raw_response.content: the content of the page!
     # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
-    soup = BeautifulSoup(resp.raw_response.content, "lxml")
-    next_links = [a["href"] for a in soup.find_all("a", href=True)]
-    next_links = [urljoin(url, link) for link in next_links]
-    next_links = [urldefrag(link)[0] for link in next_links]
-    return next_links
+    if document is None:
+        document = ParsedDocument(url, resp.raw_response.content)
+    return document.links
 
 
 def is_valid(url, data_storage=None) -> bool:
     # Decide whether to crawl this url or not.
     # If you decide to crawl it, return True; otherwise return False.
-    # There are already some conditions that return False.
-    try:
-        canonicalized_url = canonicalize_url(url)
-
-        if data_storage is not None:
-            with data_storage.visited_url_lock:
-                if url in data_storage.visited_url:
-                    return False
-
-        parsed = urlparse(canonicalized_url)
-        if parsed.hostname is None:
-            return False
-        if parsed.scheme not in {"http", "https"}:
-            return False
-        if len(url) > MAX_URL_LENGTH:
-            return False
-        if not re.match(
-                r"(.*\.ics\.uci\.edu.*)|"
-                r"(.*\.cs\.uci\.edu.*)|"
-                r"(.*\.informatics\.uci\.edu.*)|"
-                r"(.*\.stat\.uci\.edu.*)|"
-                r"(today\.uci\.edu/department/information_computer_sciences.*)",
-                parsed.hostname,
-        ):
-            return False
-        if re.match(
-                r".*\.(css|js|bmp|gif|jpe?g|ico|swp"
-                + r"|png|tiff?|mlid|mp2|mp3|mp4|tmp"
-                + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf|bak"
-                + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names|php"
-                + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|asm|toml"
-                + r"|epub|dll|cnf|tgz|sha1|exe|app|xml|json|jsx|h|hpp|yaml"
-                + r"|thmx|mso|arff|rtf|jar|csv|py|java|jar|scss|c|war|ini"
-                + r"|flv|mpg|3gp|flac|aac|svg|webp|odt|ods|odp|odg|sqlite"
-                + r"|zpix|tar.gz|rar|7z|xz|sh|bat|dll|so|ttf|woff|eot|otf"
-                + r"|rm|smil|wmv|swf|wma|zip|rar|gz|txt|img|sql|pdf|cpp)$",
-                parsed.path.lower(),
-        ):
-            return False
-
-        return True
-
-    except TypeError:
-        print("TypeError for ", parsed)
-        raise
-
-
-def extract_curr_content(resp) -> dict:
-    soup = BeautifulSoup(resp.raw_response.content, "lxml")
-    raw_text = soup.text
-    processed_text = filter_text(raw_text)
-    words = tokenize(processed_text)
-    word_frequencies = compute_word_frequencies(words)
-    return word_frequencies
+    # The rules themselves live in utils/url_filter.py.
+    return DEFAULT_URL_FILTER.is_valid(url, data_storage)
+
+
+def extract_curr_content(resp, document=None) -> dict:
+    if document is None:
+        document = ParsedDocument(resp.url, resp.raw_response.content)
+    return document.word_frequencies
 
 
 def update_longest_page(url, words_freq, longest_page):
@@ -122,8 +75,7 @@ def update_longest_page(url, words_freq, longest_page):
 
 
 def update_common_words(words_freq, common_words):
-    for word, count in words_freq.items():
-        common_words[word] = common_words.get(word, 0) + count
+    common_words.add(words_freq)
 
 
 def canonicalize_url(url):
@@ -0,0 +1,128 @@
+import asyncio
+from urllib.parse import urlencode
+
+from utils.download import DownloadAborted, ENVELOPE_ALLOWANCE, CHUNK_SIZE
+
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class AsyncCacheClient(object):
+    """
+    Minimal asyncio HTTP/1.1 client for the cache server's single GET
+    endpoint. Keep-alive connections are pooled and shared by every
+    in-flight fetch; timeouts and retries follow the same [CONNECTION]
+    settings as utils.download.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.idle_connections = []
+
+
+    async def fetch(self, url, logger=None, max_size=None):
+        """
+        Return (status code, body) for `url`, or None if the cache could not
+        be reached. Raises DownloadAborted once the body cannot fit in
+        `max_size` (see utils.download.download).
+        """
+        host, port = self.config.cache_server
+        path = "/?" + urlencode([("q", url), ("u", self.config.user_agent)])
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Accept-Encoding: identity\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode("latin-1")
+
+        error = None
+        for attempt in range(self.config.download_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.config.retry_backoff * 2 ** (attempt - 1))
+            try:
+                status, body = await self._request(request, max_size)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                error = e
+                continue
+            if status in RETRY_STATUSES and attempt < self.config.download_retries:
+                error = f"status {status}"
+                continue
+            return status, body
+        if logger:
+            logger.error(f"Download of {url} from cache failed: {error!r}")
+        return None
+
+
+    async def close(self):
+        for _, writer in self.idle_connections:
+            writer.close()
+        self.idle_connections = []
+
+
+    async def _request(self, request, max_size):
+        reader, writer = await self._connect()
+        try:
+            writer.write(request)
+            status, body, keep_alive = await asyncio.wait_for(
+                self._read_response(reader, max_size), self.config.read_timeout)
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self.idle_connections.append((reader, writer))
+        else:
+            writer.close()
+        return status, body
+
+
+    async def _connect(self):
+        while self.idle_connections:
+            reader, writer = self.idle_connections.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        host, port = self.config.cache_server
+        return await asyncio.wait_for(asyncio.open_connection(host, port), self.config.connect_timeout)
+
+
+    @staticmethod
+    async def _read_response(reader, max_size):
+        limit = None if max_size is None else max_size + ENVELOPE_ALLOWANCE
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = status_line.startswith(b"HTTP/1.1") and headers.get("connection", "").lower() != "close"
+        # Aborting leaves unread bytes on the connection, so _request closes it.
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                if limit is not None and len(body) + size > limit:
+                    raise DownloadAborted(f"received over {limit} bytes, over the {max_size} byte limit")
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+            body = bytes(body)
+        elif "content-length" in headers:
+            content_length = int(headers["content-length"])
+            if limit is not None and content_length > limit:
+                raise DownloadAborted(f"cache announced {content_length} bytes, over the {max_size} byte limit")
+            body = await reader.readexactly(content_length)
+        else:
+            body = bytearray()
+            while not reader.at_eof():
+                body += await reader.read(CHUNK_SIZE)
+                if limit is not None and len(body) > limit:
+                    raise DownloadAborted(f"received over {limit} bytes, over the {max_size} byte limit")
+            body = bytes(body)
+            keep_alive = False
+        return status, body, keep_alive
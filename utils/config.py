@@ -8,12 +8,50 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.engine = config["LOCAL PROPERTIES"].get("ENGINE", "threads")
+        self.max_in_flight = int(config["LOCAL PROPERTIES"].get("MAX_IN_FLIGHT", 200))
+        self.parse_processes = int(config["LOCAL PROPERTIES"].get("PARSE_PROCESSES", 0))
+        self.parse_queue_size = int(config["LOCAL PROPERTIES"].get("PARSE_QUEUE_SIZE", 2 * self.parse_processes or 1))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.store_backend = config["LOCAL PROPERTIES"].get("STORE", "shelve")
+        self.commit_batch_size = int(config["LOCAL PROPERTIES"].get("COMMIT_BATCH_SIZE", 500))
+        self.durability_window = float(config["LOCAL PROPERTIES"].get("DURABILITY_WINDOW", 5))
+        self.seen_index_capacity = int(config["LOCAL PROPERTIES"].get("SEEN_INDEX_CAPACITY", 65536))
+        self.bloom_filter_capacity = int(config["LOCAL PROPERTIES"].get("BLOOM_FILTER_CAPACITY", 0))
+        self.frontier_memory_budget = int(config["LOCAL PROPERTIES"].get("FRONTIER_MEMORY_BUDGET", 0))
+        self.spill_dir = config["LOCAL PROPERTIES"].get("SPILL_DIR", "frontier_spill")
+        self.fingerprint_dir = config["LOCAL PROPERTIES"].get("FINGERPRINT_DIR", "fingerprints")
+        self.word_sketch_width = int(config["LOCAL PROPERTIES"].get("WORD_SKETCH_WIDTH", 0))
+        self.page_store = config["LOCAL PROPERTIES"].get("PAGE_STORE", "memory")
+        assert self.page_store in ("memory", "sqlite"), "PAGE_STORE should be memory or sqlite"
+        self.page_store_file = config["LOCAL PROPERTIES"].get("PAGE_STORE_FILE", "pages.sqlite")
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = float(config["CONNECTION"].get("CONNECT_TIMEOUT", 5))
+        self.read_timeout = float(config["CONNECTION"].get("READ_TIMEOUT", 30))
+        self.download_retries = int(config["CONNECTION"].get("RETRIES", 3))
+        self.retry_backoff = float(config["CONNECTION"].get("RETRY_BACKOFF", 0.5))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
+        self.allowed_domains = config["CRAWLER"].get(
+            "ALLOWED_DOMAINS", "ics.uci.edu,cs.uci.edu,informatics.uci.edu,stat.uci.edu").split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.trap_min_samples = int(config["CRAWLER"].get("TRAP_MIN_SAMPLES", 20))
+        self.trap_ban_yield = float(config["CRAWLER"].get("TRAP_BAN_YIELD", 0.2))
+        self.trap_throttle_yield = float(config["CRAWLER"].get("TRAP_THROTTLE_YIELD", 0.5))
+        self.trap_max_templates = int(config["CRAWLER"].get("TRAP_MAX_TEMPLATES", 50000))
+        self.simhash_distance = int(config["CRAWLER"].get("SIMHASH_DISTANCE", 3))
+
+        self.link_extractor = config["LOCAL PROPERTIES"].get("LINK_EXTRACTOR", "lxml")
+        assert self.link_extractor in ("lxml", "bs4"), "LINK_EXTRACTOR should be lxml or bs4"
+        self.response_cache_mode = config["LOCAL PROPERTIES"].get("RESPONSE_CACHE", "off")
+        assert self.response_cache_mode in ("off", "record", "replay", "read-through"), \
+            "RESPONSE_CACHE should be one of off, record, replay and read-through"
+        self.response_cache_dir = config["LOCAL PROPERTIES"].get("RESPONSE_CACHE_DIR", "response_cache")
+        self.response_cache_max_bytes = int(config["LOCAL PROPERTIES"].get("RESPONSE_CACHE_MAX_MB", 2048)) * 1024 * 1024
+        if self.response_cache_mode == "replay":
+            # Replay never touches the cache server, so there is no one to be polite to.
+            self.time_delay = 0
 
         self.cache_server = None
\ No newline at end of file
@@ -1,21 +1,247 @@
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
 import requests
 import cbor
 import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from utils import get_urlhash, normalize
 from utils.response import Response
 
-def download(url, config, logger=None):
+# One keep-alive session per worker thread, so every fetch after the first
+# reuses its connection to the cache server.
+_thread_local = threading.local()
+
+# Status given to responses whose transfer was cut short by a download rule;
+# the cache server itself only uses 600-606.
+DOWNLOAD_ABORTED_STATUS = 690
+# The cache server wraps the page in CBOR and a pickled requests.Response,
+# so its body may exceed the page size limit by this much.
+ENVELOPE_ALLOWANCE = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadAborted(Exception):
+    pass
+
+
+class ResponseCache(object):
+    """
+    Content-addressed on-disk store of cache server payloads (the CBOR
+    body), keyed by the hash of the normalized url and zlib-compressed.
+
+    The index maps each key to its compressed size in least- to most-
+    recently-used order, so lookups never touch the directory and the
+    oldest entries are evicted once the total exceeds `max_bytes`. It is
+    saved to index.json every INDEX_SAVE_INTERVAL writes and on close.
+    """
+    INDEX_FILE = "index.json"
+    INDEX_SAVE_INTERVAL = 500
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.cache_lock = threading.Lock()
+        self.index = OrderedDict()
+        self.total_bytes = 0
+        self.unsaved_writes = 0
+        self._load_index()
+
+
+    def get(self, url):
+        key = get_urlhash(normalize(url))
+        with self.cache_lock:
+            if key not in self.index:
+                return None
+            self.index.move_to_end(key)
+        try:
+            with open(self._entry_path(key), "rb") as f:
+                return zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            with self.cache_lock:
+                self.total_bytes -= self.index.pop(key, 0)
+            return None
+
+
+    def put(self, url, payload):
+        key = get_urlhash(normalize(url))
+        data = zlib.compress(payload)
+        path = self._entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self.cache_lock:
+            self.total_bytes += len(data) - self.index.pop(key, 0)
+            self.index[key] = len(data)
+            while self.total_bytes > self.max_bytes and len(self.index) > 1:
+                evicted_key, size = self.index.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(self._entry_path(evicted_key))
+                except OSError:
+                    pass
+            self.unsaved_writes += 1
+            if self.unsaved_writes >= self.INDEX_SAVE_INTERVAL:
+                self._save_index()
+
+
+    def close(self):
+        with self.cache_lock:
+            self._save_index()
+
+
+    def _entry_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.cbor.z"
+
+
+    def _load_index(self):
+        index_path = self.cache_dir / self.INDEX_FILE
+        if index_path.exists():
+            with open(index_path) as f:
+                entries = json.load(f)
+        else:
+            # No index yet (or it was lost): rebuild it from the entry files,
+            # oldest first.
+            paths = sorted(self.cache_dir.glob("*/*.cbor.z"), key=lambda path: path.stat().st_mtime)
+            entries = [(path.name.split(".")[0], path.stat().st_size) for path in paths]
+        for key, size in entries:
+            self.index[key] = size
+            self.total_bytes += size
+
+
+    def _save_index(self):
+        index_path = self.cache_dir / self.INDEX_FILE
+        temp_path = index_path.with_name(f"{self.INDEX_FILE}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(list(self.index.items()), f)
+        os.replace(temp_path, index_path)
+        self.unsaved_writes = 0
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache(config):
+    """Return the process-wide ResponseCache, or None if RESPONSE_CACHE is off."""
+    global _response_cache
+    if config.response_cache_mode == "off":
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(config.response_cache_dir, config.response_cache_max_bytes)
+        return _response_cache
+
+
+def close_response_cache():
+    with _response_cache_lock:
+        if _response_cache is not None:
+            _response_cache.close()
+
+
+def cached_response(url, config, logger=None):
+    """
+    Return the Response for `url` from the local response cache, or None if
+    it has to come from the cache server. In replay mode there is no server,
+    so None means the download failed.
+    """
+    if config.response_cache_mode not in ("replay", "read-through"):
+        return None
+    payload = get_response_cache(config).get(url)
+    if payload is not None:
+        return build_response(url, 200, payload, logger)
+    if config.response_cache_mode == "replay" and logger:
+        logger.error(f"{url} is not in the replay cache.")
+    return None
+
+
+def store_response(url, config, status_code, content):
+    if config.response_cache_mode in ("record", "read-through") and status_code == 200 and content:
+        get_response_cache(config).put(url, content)
+
+
+def get_session(config):
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        retries = Retry(
+            total=config.download_retries,
+            backoff_factor=config.retry_backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=("GET",))
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retries))
+        _thread_local.session = session
+    return session
+
+
+def download(url, config, logger=None, max_size=None):
+    """
+    Fetch `url` through the cache server, streaming the body. If `max_size`
+    is given, the transfer is aborted as soon as the announced or received
+    size shows the page cannot fit, and a response with status
+    DOWNLOAD_ABORTED_STATUS and the reason in `error` is returned instead.
+    """
+    resp = cached_response(url, config, logger)
+    if resp is not None or config.response_cache_mode == "replay":
+        return resp
     host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        with get_session(config).get(
+                f"http://{host}:{port}/",
+                params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+                timeout=(config.connect_timeout, config.read_timeout),
+                stream=True) as resp:
+            content = read_limited(resp.headers.get("Content-Length"), resp.iter_content(CHUNK_SIZE), max_size)
+    except requests.RequestException as e:
+        if logger:
+            logger.error(f"Download of {url} from cache failed: {e}")
+        return None
+    except DownloadAborted as e:
+        return aborted_response(url, str(e))
+    store_response(url, config, resp.status_code, content)
+    return build_response(url, resp.status_code, content, logger)
+
+
+def read_limited(content_length, chunks, max_size):
+    """Join `chunks`, raising DownloadAborted once they cannot fit in `max_size`."""
+    limit = None if max_size is None else max_size + ENVELOPE_ALLOWANCE
+    if limit is not None and content_length is not None and int(content_length) > limit:
+        raise DownloadAborted(f"cache announced {content_length} bytes, over the {max_size} byte limit")
+    received = []
+    received_size = 0
+    for chunk in chunks:
+        received_size += len(chunk)
+        if limit is not None and received_size > limit:
+            raise DownloadAborted(f"received over {limit} bytes, over the {max_size} byte limit")
+        received.append(chunk)
+    return b"".join(received)
+
+
+def aborted_response(url, reason):
+    return Response({
+        "error": f"Download aborted: {reason}.",
+        "status": DOWNLOAD_ABORTED_STATUS,
+        "url": url})
+
+
+def build_response(url, status_code, content, logger=None):
+    try:
+        if status_code < 400 and content:
+            return Response(cbor.loads(content))
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(f"Spacetime Response error <{status_code}> with url {url}.")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
+        "error": f"Spacetime Response error <{status_code}> with url {url}.",
+        "status": status_code,
         "url": url})
@@ -0,0 +1,57 @@
+from urllib.parse import urljoin, urldefrag
+
+
+class LinkExtractor(object):
+    """
+    Collects the targets of every <a href> on a page, resolved against the
+    page url (or its <base href>, if it has one) and without fragments.
+    """
+    def extract(self, url, document):
+        raise NotImplementedError
+
+
+    @staticmethod
+    def resolve(url, base_href, hrefs):
+        base = urljoin(url, base_href.strip()) if base_href is not None else url
+        return [urldefrag(urljoin(base, href.strip()))[0] for href in hrefs]
+
+
+class LxmlLinkExtractor(LinkExtractor):
+    """
+    Walks only the <a> and <base> elements of the document's lxml tree,
+    the same tree its visible text is read from, without BeautifulSoup's
+    Python-level tree.
+    """
+    def extract(self, url, document):
+        root = document.tree
+        if root is None:
+            return []
+        base_href = None
+        hrefs = []
+        for element in root.iter("a", "base"):
+            href = element.get("href")
+            if href is None:
+                continue
+            if element.tag == "a":
+                hrefs.append(href)
+            elif base_href is None:
+                base_href = href
+        return self.resolve(url, base_href, hrefs)
+
+
+class SoupLinkExtractor(LinkExtractor):
+    """Reads links from the document's BeautifulSoup tree; the reference backend."""
+    def extract(self, url, document):
+        base = document.soup.find("base", href=True)
+        hrefs = [a["href"] for a in document.soup.find_all("a", href=True)]
+        return self.resolve(url, base["href"] if base is not None else None, hrefs)
+
+
+LINK_EXTRACTORS = {
+    "lxml": LxmlLinkExtractor,
+    "bs4": SoupLinkExtractor,
+}
+
+
+def get_link_extractor(name):
+    return LINK_EXTRACTORS[name]()
@@ -0,0 +1,153 @@
+"""
+Local stand-in for the spacetime cache server, backed by a SyntheticWeb.
+
+It speaks the same protocol as the real server: the Register handshake of
+utils.pcc_models on the registration port, then GET /?q=<url>&u=<agent>
+answered with a CBOR map holding url, status and a pickled
+requests.Response. Point HOST and PORT in config.ini at the registration
+port and seed the crawler with the printed urls:
+
+    python -m utils.local_cache_server --port 9000 --hosts 40 --pages-per-host 500
+"""
+import pickle
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from utils.synthetic_web import SyntheticWeb
+
+
+REGISTRATION_POLL_TIMEOUT = 1
+
+
+def make_cache_payload(url, status, content, headers):
+    raw_response = requests.Response()
+    raw_response.status_code = status
+    raw_response._content = content
+    raw_response.headers = CaseInsensitiveDict(headers)
+    raw_response.url = url
+    raw_response.encoding = "utf-8"
+    return cbor.dumps({"url": url, "status": status, "response": pickle.dumps(raw_response)})
+
+
+class LocalCacheServer(object):
+    def __init__(self, web, host="127.0.0.1", port=0):
+        self.web = web
+        self.requests_served = 0
+        self.served_lock = threading.Lock()
+        server = self
+
+        class CacheRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                if "q" not in query or "u" not in query:
+                    self.send_error(400, "Expected q and u query parameters")
+                    return
+                body = server.answer(query["q"][0])
+                self.send_response(200)
+                self.send_header("Content-Type", "application/cbor")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer((host, port), CacheRequestHandler)
+        self.http_server.daemon_threads = True
+        self.address = self.http_server.server_address
+
+
+    def answer(self, url):
+        time.sleep(self.web.latency(url))
+        final_url, status, content, headers = self.web.respond(url)
+        with self.served_lock:
+            self.requests_served += 1
+        return make_cache_payload(final_url, status, content, headers)
+
+
+    def start(self):
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        return self.address
+
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+
+def serve_registrations(df, cache_address):
+    # Give every new Register the local cache server as its load balancer;
+    # the crawler deletes the Register once it has read it.
+    from utils.pcc_models import Register
+    while True:
+        try:
+            df.checkout_await(REGISTRATION_POLL_TIMEOUT)
+        except TimeoutError:
+            continue
+        for registration in df.read_all(Register):
+            if not registration.load_balancer:
+                registration.load_balancer = tuple(cache_address)
+        df.commit()
+
+
+def start_registration_node(port, cache_address):
+    # spacetime is only needed when the crawler registers through launch.py.
+    from spacetime import Node
+    from utils.pcc_models import Register
+    node = Node(serve_registrations, server_port=port, Types=[Register], threading=True)
+    node.daemon = True
+    node.start_async(cache_address)
+    return node
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000, help="registration port (PORT in config.ini)")
+    parser.add_argument("--cache-port", type=int, default=0, help="HTTP port for page requests, 0 picks one")
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--pages-per-host", type=int, default=200)
+    parser.add_argument("--fan-out", type=int, default=15)
+    parser.add_argument("--min-words", type=int, default=200)
+    parser.add_argument("--max-words", type=int, default=2000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--near-duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--trap-host-rate", type=float, default=0.1)
+    parser.add_argument("--redirect-rate", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="median response latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="sigma of the lognormal latency")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    web = SyntheticWeb(
+        hosts=args.hosts, pages_per_host=args.pages_per_host, fan_out=args.fan_out,
+        min_words=args.min_words, max_words=args.max_words,
+        duplicate_rate=args.duplicate_rate, near_duplicate_rate=args.near_duplicate_rate,
+        trap_host_rate=args.trap_host_rate, redirect_rate=args.redirect_rate, error_rate=args.error_rate,
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, seed=args.seed)
+    cache_server = LocalCacheServer(web, args.host, args.cache_port)
+    cache_address = cache_server.start()
+    start_registration_node(args.port, cache_address)
+    print(f"Cache server on {cache_address[0]}:{cache_address[1]}, registration on {args.host}:{args.port}.")
+    print(f"Trap hosts: {', '.join(sorted(web.trap_hosts)) or 'none'}")
+    print(f"SEEDURL = {','.join(web.seed_urls())}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{cache_server.requests_served} requests served.")
+    except KeyboardInterrupt:
+        cache_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+
+from utils.link_extractor import get_link_extractor
+from utils.parsed_document import ParsedDocument
+
+
+# The ParsedDocument views the crawler's checks and scraper read. A parse
+# process computes all of them in one go and sends back only these, never
+# the decoded html or the DOM.
+PARSED_VIEWS = ("md5", "content_simhash", "text_fingerprint", "dates", "word_frequencies", "links")
+
+_process_link_extractor = None
+
+
+def init_parse_process(link_extractor):
+    global _process_link_extractor
+    _process_link_extractor = get_link_extractor(link_extractor)
+
+
+def parse_page(url, content):
+    """
+    Runs in a parse process: every view in PARSED_VIEWS of one page, and the
+    seconds parsing took. A view that fails is sent back as its exception,
+    raised again only where that view is read, as it would be without the
+    pool.
+    """
+    start = time.perf_counter()
+    document = ParsedDocument(url, content, _process_link_extractor)
+    views = {}
+    for name in PARSED_VIEWS:
+        try:
+            views[name] = getattr(document, name)
+        except Exception as e:
+            views[name] = e
+    if isinstance(views["word_frequencies"], dict):
+        views["word_frequencies"] = dict(views["word_frequencies"])
+    return views, time.perf_counter() - start
+
+
+def pooled_view(name):
+    def view(document):
+        value = document.parsed[name]
+        if isinstance(value, Exception):
+            raise value
+        return value
+    return cached_property(view)
+
+
+class PooledDocument(ParsedDocument):
+    """
+    A ParsedDocument whose PARSED_VIEWS a ParsePool has already computed,
+    `parsed` being what parse_page sent back for it.
+    """
+    def __init__(self, url, content, parsed):
+        super().__init__(url, content)
+        self.parsed = parsed
+
+
+    def parse(self):
+        # Parsed in the pool before the document was made.
+        pass
+
+
+    md5 = pooled_view("md5")
+    content_simhash = pooled_view("content_simhash")
+    text_fingerprint = pooled_view("text_fingerprint")
+    dates = pooled_view("dates")
+    word_frequencies = pooled_view("word_frequencies")
+    links = pooled_view("links")
+
+
+class ParsePool(object):
+    """
+    Parse stage of the crawl pipeline, run in `processes` processes so
+    decoding, tokenizing and hashing pages is not serialized on the GIL.
+
+    Fetch threads (or the asyncio engine's executor) submit raw page bytes
+    with a callback and go back to fetching. Pages are parsed as processes
+    free up, and a single consumer thread runs the callbacks, which check
+    and scrape the parsed pages, in the order the parses finish.
+
+    At most `queue_size` pages are queued, being parsed or waiting for the
+    consumer; a fetch thread that would exceed that blocks in submit(), so
+    fetching slows down to what the parse and scrape stages keep up with
+    instead of piling pages up in memory.
+
+    Processes are spawned rather than forked, as the crawler forks from a
+    process already running threads.
+    """
+    def __init__(self, processes, queue_size, link_extractor="lxml"):
+        self.executor = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_parse_process, initargs=(link_extractor,))
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.parsed = queue.Queue()
+        self.progress_lock = threading.Lock()
+        self.submitted = 0
+        self.finished = 0
+        self.consumer = threading.Thread(target=self._consume, daemon=True)
+        self.consumer.start()
+
+
+    def submit(self, url, content, callback):
+        """
+        Queue a page for parsing. Once it is parsed, `callback(document,
+        seconds)` runs on the consumer thread with its PooledDocument and
+        the seconds the parse took; a page whose parse failed is dropped.
+        """
+        self.slots.acquire()
+        with self.progress_lock:
+            self.submitted += 1
+        try:
+            future = self.executor.submit(parse_page, url, content)
+        except Exception:
+            self._finish()
+            raise
+        future.add_done_callback(lambda future: self.parsed.put((future, url, content, callback)))
+
+
+    def progress(self):
+        """Pages submitted, and pages done with: consumed, dropped or cancelled."""
+        with self.progress_lock:
+            return self.submitted, self.finished
+
+
+    def close(self):
+        """
+        Stop parsing: pages still queued are dropped, and those being parsed
+        are consumed before this returns.
+        """
+        # Every future's done callback has run once shutdown returns, so the
+        # None is queued behind the last page.
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.parsed.put(None)
+        self.consumer.join()
+
+
+    def _consume(self):
+        while True:
+            item = self.parsed.get()
+            if item is None:
+                return
+            future, url, content, callback = item
+            try:
+                if not future.cancelled():
+                    views, seconds = future.result()
+                    callback(PooledDocument(url, content, views), seconds)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._finish()
+
+
+    def _finish(self):
+        with self.progress_lock:
+            self.finished += 1
+        self.slots.release()
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool(config):
+    """The crawl's shared ParsePool, or None to parse in the fetching thread."""
+    global _parse_pool
+    if not config.parse_processes:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ParsePool(config.parse_processes, config.parse_queue_size, config.link_extractor)
+        return _parse_pool
+
+
+def close_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.close()
+            _parse_pool = None
@@ -0,0 +1,165 @@
+import hashlib
+import re
+import threading
+from functools import cached_property
+
+from lxml import etree
+
+from utils.link_extractor import get_link_extractor
+from utils.text_processor import count_words
+
+
+DATE_REGEX = re.compile(r'\b\d{4}-\d{1,2}-\d{1,2}\b')
+DEFAULT_LINK_EXTRACTOR = get_link_extractor("lxml")
+# Elements whose contents BeautifulSoup's get_text() leaves out.
+INVISIBLE_TAGS = frozenset(["script", "style", "template"])
+
+_parsers = threading.local()
+
+
+def html_parser(encoding):
+    """This thread's lxml parser for `encoding`; lxml parsers must not be shared between threads."""
+    parsers = getattr(_parsers, "by_encoding", None)
+    if parsers is None:
+        parsers = _parsers.by_encoding = {}
+    parser = parsers.get(encoding)
+    if parser is None:
+        parser = parsers[encoding] = etree.HTMLParser(encoding=encoding, remove_comments=True)
+    return parser
+
+
+class ParsedDocument(object):
+    """
+    One downloaded page, decoded and parsed at most once.
+
+    Every view of the page (decoded html, DOM, visible text, word
+    frequencies, links) is computed on first use and cached, so the
+    worker's checks and the scraper share the work instead of each decoding
+    and parsing the raw content again. The visible text and the default
+    link extractor both read the one lxml tree; the BeautifulSoup tree is
+    only built for the bs4 link extractor. A document is used by a single
+    worker and is not thread safe.
+    """
+    def __init__(self, url, content, link_extractor=None):
+        self.url = url
+        self.content = content if content is not None else b""
+        self.link_extractor = link_extractor or DEFAULT_LINK_EXTRACTOR
+
+
+    def parse(self):
+        """
+        Decode and parse the page and count its words now, rather than in
+        whichever view first needs them.
+        """
+        self.html
+        self.word_frequencies
+
+
+    @cached_property
+    def encoding(self):
+        """
+        The page's charset: the one it declares, else utf-8 if it decodes as
+        such, else windows-1252, the same order BeautifulSoup tries them in
+        minus its slow statistical guess.
+        """
+        from bs4.dammit import EncodingDetector
+        declared = EncodingDetector.find_declared_encoding(self.content, is_html=True)
+        for encoding in (declared, "utf-8"):
+            if encoding is None:
+                continue
+            try:
+                self.content.decode(encoding)
+                return encoding
+            except (LookupError, UnicodeDecodeError):
+                pass
+        return "windows-1252"
+
+
+    @cached_property
+    def html(self):
+        # Only for the fingerprints and the date check, which have always
+        # read the content as utf-8; the DOM is built in self.encoding.
+        return self.content.decode("utf-8", errors="ignore")
+
+
+    @cached_property
+    def soup(self):
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(self.content, "lxml", from_encoding=self.encoding)
+
+
+    @cached_property
+    def tree(self):
+        """The page's lxml DOM, parsed from the raw bytes, or None if it has none."""
+        try:
+            return etree.fromstring(self.content, html_parser(self.encoding))
+        except LookupError:
+            # A charset Python knows but libxml2 does not.
+            return etree.fromstring(self.content, html_parser("utf-8"))
+        except (etree.LxmlError, ValueError):
+            return None
+
+
+    @cached_property
+    def text(self):
+        """The visible text, as BeautifulSoup's get_text() reads it off the same DOM."""
+        root = self.tree
+        if root is None:
+            return ""
+        parts = []
+        walker = etree.iterwalk(root, events=("start", "end"))
+        for event, element in walker:
+            if event == "start":
+                if element.tag in INVISIBLE_TAGS or not isinstance(element.tag, str):
+                    walker.skip_subtree()
+                elif element.text:
+                    parts.append(element.text)
+            elif element.tail:
+                parts.append(element.tail)
+        return "".join(parts)
+
+
+    @cached_property
+    def word_frequencies(self):
+        return count_words(self.text)
+
+
+    @cached_property
+    def text_fingerprint(self):
+        """64-bit hash of the visible text's word frequencies, markup and numbers excluded."""
+        frequencies = self.word_frequencies
+        # Words are letters only, so word and count need no separator.
+        key = " ".join(f"{word}{frequencies[word]}" for word in sorted(frequencies))
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+    @cached_property
+    def md5(self):
+        return hashlib.md5(self.content).digest()
+
+
+    @cached_property
+    def content_simhash(self):
+        """
+        Simhash of the visible text's word frequencies, the crawler's
+        near-duplicate fingerprint; None for a page without words, which
+        has nothing to compare.
+        """
+        from simhash import Simhash
+        if not self.word_frequencies:
+            return None
+        # Weighted by raw counts, the most frequent words, which every page
+        # shares, would decide every bit; a word weighs 1 + log2 of its count.
+        return Simhash({word: count.bit_length() for word, count in self.word_frequencies.items()}).value
+
+
+    @cached_property
+    def dates(self):
+        """Distinct yyyy-mm-dd dates written anywhere in the html."""
+        return set(DATE_REGEX.findall(self.html))
+
+
+    @cached_property
+    def links(self):
+        """Absolute, defragmented targets of every <a href> on the page."""
+        return self.link_extractor.extract(self.url, self)
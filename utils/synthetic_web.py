@@ -0,0 +1,177 @@
+import itertools
+import random
+from urllib.parse import urlparse, parse_qs
+
+
+DOMAINS = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+SYLLABLES = [
+    "ka", "lo", "mi", "ne", "ru", "ta", "shi", "po", "fe", "gar", "den", "qui",
+    "sta", "tor", "vel", "win", "bra", "cor", "dra", "lin", "mon", "pre", "son", "tri",
+]
+VOCABULARY_SIZE = 5000
+TRAP_PREFIXES = ["/archive/", "/wiki/doku.php"]
+
+
+def make_vocabulary(size, seed=0):
+    rng = random.Random(seed)
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(vocabulary)
+
+
+class SyntheticWeb(object):
+    """
+    Deterministic generator of a synthetic web graph over uci.edu hosts.
+
+    Every url is answered from a random.Random seeded with (seed, url), so
+    the same parameters always produce the same site. Pages are
+    https://<host>/page/<n> (page 0 is the host root) with Zipf-distributed
+    words and about `fan_out` links, mostly to the same host. Part of the
+    pages are exact or near duplicates of other pages, redirect, or fail,
+    and trap hosts link into infinite paginated archives and wiki revision
+    histories that the crawler's hard-coded patterns do not catch.
+    """
+    def __init__(self, hosts=20, pages_per_host=200, fan_out=15, min_words=200, max_words=2000,
+                 duplicate_rate=0.05, near_duplicate_rate=0.05, trap_host_rate=0.1,
+                 redirect_rate=0.02, error_rate=0.01, latency_ms=20.0, latency_sigma=0.5, seed=0):
+        self.pages_per_host = pages_per_host
+        self.fan_out = fan_out
+        self.min_words = min_words
+        self.max_words = max_words
+        self.duplicate_rate = duplicate_rate
+        self.near_duplicate_rate = near_duplicate_rate
+        self.redirect_rate = redirect_rate
+        self.error_rate = error_rate
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.seed = seed
+
+        rng = random.Random(seed)
+        self.hosts = [
+            f"{'www' if i < len(DOMAINS) else f'site{i}'}.{DOMAINS[i % len(DOMAINS)]}"
+            for i in range(hosts)
+        ]
+        self.host_set = set(self.hosts)
+        self.trap_hosts = set(rng.sample(self.hosts, round(trap_host_rate * len(self.hosts))))
+        self.vocabulary = make_vocabulary(VOCABULARY_SIZE, seed)
+        self.cumulative_weights = list(itertools.accumulate(1 / rank for rank in range(1, VOCABULARY_SIZE + 1)))
+
+
+    def seed_urls(self):
+        return [f"https://{host}" for host in self.hosts[:len(DOMAINS)]]
+
+
+    def latency(self, url):
+        """Seconds the server should wait before answering `url`."""
+        if not self.latency_ms:
+            return 0
+        return random.Random(f"{self.seed}:latency:{url}").lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+
+
+    def respond(self, url):
+        """Return (final url, status, html body, headers) for `url`."""
+        parsed = urlparse(url)
+        host = parsed.hostname
+        if host not in self.host_set:
+            return url, 404, b"<html><body>Not found</body></html>", {"Content-Type": "text/html"}
+        if parsed.path.startswith(tuple(TRAP_PREFIXES)) and host in self.trap_hosts:
+            return url, 200, self._trap_page(host, parsed), {"Content-Type": "text/html"}
+
+        page = self._page_number(parsed.path)
+        if page is None or page >= self.pages_per_host:
+            return url, 404, b"<html><body>Not found</body></html>", {"Content-Type": "text/html"}
+        rng = random.Random(f"{self.seed}:{host}:{page}")
+        if rng.random() < self.error_rate:
+            return url, 500, b"<html><body>Internal server error</body></html>", {"Content-Type": "text/html"}
+        if rng.random() < self.redirect_rate:
+            page = (page + 1) % self.pages_per_host
+            url = self._page_url(host, page)
+        return url, 200, self._page_body(host, page), {"Content-Type": "text/html; charset=utf-8"}
+
+
+    def _page_body(self, host, page):
+        rng = random.Random(f"{self.seed}:{host}:{page}:body")
+        roll = rng.random()
+        if page > 0 and roll < self.duplicate_rate:
+            return self._page_body(host, rng.randrange(page))
+        if page > 0 and roll < self.duplicate_rate + self.near_duplicate_rate:
+            # Same text as an earlier page with 2% of the words replaced.
+            words = self._page_words(host, rng.randrange(page))
+            for i in rng.sample(range(len(words)), max(1, len(words) // 50)):
+                words[i] = rng.choice(self.vocabulary)
+        else:
+            words = self._page_words(host, page)
+        links = self._links(rng, host)
+        if host in self.trap_hosts:
+            links.append(f"{TRAP_PREFIXES[0]}{page}?page=1")
+            links.append(f"https://{host}{TRAP_PREFIXES[1]}?id=page{page}&rev=1")
+        return self._render(f"{host} page {page}", words, links)
+
+
+    def _page_words(self, host, page):
+        rng = random.Random(f"{self.seed}:{host}:{page}:words")
+        return self._words(rng, rng.randint(self.min_words, self.max_words))
+
+
+    def _trap_page(self, host, parsed):
+        query = parse_qs(parsed.query)
+        counter = int((query.get("page") or query.get("rev") or ["1"])[0])
+        rng = random.Random(f"{self.seed}:{host}:trap:{parsed.path}")
+        # Every page of a trap shows nearly the same text.
+        words = self._words(rng, self.min_words) + [str(counter)]
+        if parsed.path.startswith(TRAP_PREFIXES[0]):
+            links = [f"{parsed.path}?page={counter + 1}", f"{parsed.path}?page={counter + 2}"]
+        else:
+            page_id = query.get("id", ["start"])[0]
+            links = [f"{parsed.path}?id={page_id}&rev={counter + 1}", f"{parsed.path}?id={page_id}&do=diff&rev={counter}"]
+        return self._render(f"{host} {parsed.path} {counter}", words, links)
+
+
+    def _links(self, rng, host):
+        links = []
+        for _ in range(rng.randint(self.fan_out // 2, self.fan_out * 3 // 2)):
+            roll = rng.random()
+            if roll < 0.75:
+                link = self._page_url(host, rng.randrange(self.pages_per_host))
+                if rng.random() < 0.3:
+                    link = urlparse(link).path or "/"
+            elif roll < 0.95:
+                other_host = rng.choice(self.hosts)
+                link = self._page_url(other_host, rng.randrange(self.pages_per_host))
+            elif roll < 0.98:
+                link = f"https://www.example.com/{rng.randrange(1000)}"
+            else:
+                link = f"https://{host}/files/report{rng.randrange(100)}.pdf"
+            if rng.random() < 0.05:
+                link += f"#section{rng.randrange(5)}"
+            links.append(link)
+        return links
+
+
+    def _words(self, rng, count):
+        return rng.choices(self.vocabulary, cum_weights=self.cumulative_weights, k=count)
+
+
+    @staticmethod
+    def _page_url(host, page):
+        return f"https://{host}" if page == 0 else f"https://{host}/page/{page}"
+
+
+    @staticmethod
+    def _page_number(path):
+        if path in ("", "/"):
+            return 0
+        if path.startswith("/page/") and path[6:].isdigit():
+            return int(path[6:])
+        return None
+
+
+    @staticmethod
+    def _render(title, words, links):
+        paragraphs = "".join(f"<p>{' '.join(words[i:i + 60])}</p>\n" for i in range(0, len(words), 60))
+        anchors = "".join(f'<li><a href="{link}">{link}</a></li>\n' for link in links)
+        return (
+            f"<html><head><title>{title}</title></head><body>\n"
+            f"<h1>{title}</h1>\n{paragraphs}<ul>\n{anchors}</ul>\n</body></html>\n"
+        ).encode("utf-8")
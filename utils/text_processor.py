@@ -1,14 +1,20 @@
+import os
 import re
 from collections import defaultdict
 from typing import List, Dict
 
-import nltk
 
-nltk.download('stopwords', quiet=True)
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+# NLTK's English stopword list, shipped with the crawler so that importing
+# this module needs neither NLTK nor the network.
+STOPWORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stopwords_english.txt")
 
-stop_words = set(stopwords.words('english'))
+
+def load_stop_words(path=STOPWORDS_FILE):
+    with open(path, encoding="utf-8") as stopwords_file:
+        return {line.strip() for line in stopwords_file if line.strip()}
+
+
+stop_words = load_stop_words()
 stop_words.update(
     ["na", "us", "a", "aren't", "can't", "couldn't", "didn't", "doesn't", "don't", "hadn't", "hasn't",
      "haven't", "he'd", "he'll", "he's", "i'd", "i'll", "i'm", "i've", "isn't", "it's", "let's", "mustn't",
@@ -17,7 +23,46 @@ stop_words.update(
      "won't", "wouldn't", "you'd", "you'll", "you're", "you've"])
 
 
+# URLs and runs of anything other than ASCII letters and whitespace, which
+# filter_text deletes in its first three passes (its e-mail pass never
+# matches once "@" is gone).
+NON_WORD_REGEX = re.compile(r"https?://\S+|[^a-zA-Z\s]+")
+MIN_WORD_LENGTH = 2
+MAX_WORD_LENGTH = 15
+# The only contractions word_tokenize splits in letters-only text, all after
+# their third letter.
+TOKENIZER_CONTRACTIONS = {"cannot", "gimme", "gonna", "gotta", "lemme", "wanna"}
+
+
+def count_words(text: str) -> Dict[str, int]:
+    """
+    Compute the same word frequencies as
+    compute_word_frequencies(tokenize(filter_text(text))) in one scan.
+
+    :param text: The text to be counted.
+    :return: A dictionary mapping each lowercase word to its frequency.
+
+    Runtime Complexity:
+    - One regex substitution and one split over the text: O(n) where n is the number of characters.
+    - Each word is lowercased, checked against the stopwords and counted once: O(n) overall.
+    - No intermediate joined string or token list is built, so extra memory is O(number of words).
+    """
+    frequencies = defaultdict(int)
+    for word in NON_WORD_REGEX.sub("", text).split():
+        word = word.lower()
+        if word in TOKENIZER_CONTRACTIONS:
+            words = (word[:3], word[3:])
+        else:
+            words = (word,)
+        for word in words:
+            if MIN_WORD_LENGTH <= len(word) <= MAX_WORD_LENGTH and word not in stop_words:
+                frequencies[word] += 1
+    return frequencies
+
+
 def filter_text(text):
+    # NLTK takes a while to import and only this reference pipeline needs it.
+    from nltk.tokenize import word_tokenize
     url_pattern = r"https?://\S+"
     text = re.sub(url_pattern, '', text)
     text = re.sub(r'[^a-zA-Z\s]', '', text)
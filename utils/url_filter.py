@@ -0,0 +1,70 @@
+from urllib.parse import urlparse
+
+
+MAX_URL_LENGTH = 200
+ALLOWED_DOMAINS = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+ALLOWED_SCHEMES = frozenset(["http", "https"])
+BLOCKED_EXTENSIONS = frozenset([
+    "css", "js", "bmp", "gif", "jpeg", "jpg", "ico", "swp", "png", "tif", "tiff", "mlid", "mp2", "mp3",
+    "mp4", "tmp", "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf", "bak", "ps", "eps",
+    "tex", "ppt", "pptx", "doc", "docx", "xls", "xlsx", "names", "php", "data", "dat", "exe", "bz2", "tar",
+    "msi", "bin", "7z", "psd", "dmg", "iso", "asm", "toml", "epub", "dll", "cnf", "tgz", "sha1", "app",
+    "xml", "json", "jsx", "h", "hpp", "yaml", "thmx", "mso", "arff", "rtf", "jar", "csv", "py", "java",
+    "scss", "c", "war", "ini", "flv", "mpg", "3gp", "flac", "aac", "svg", "webp", "odt", "ods", "odp",
+    "odg", "sqlite", "zpix", "tar.gz", "rar", "xz", "sh", "bat", "so", "ttf", "woff", "eot", "otf", "rm",
+    "smil", "wmv", "swf", "wma", "zip", "gz", "txt", "img", "sql", "cpp",
+])
+
+
+class UrlFilter(object):
+    """
+    The crawler's url rules, compiled once: http(s) only, at most
+    `max_url_length` characters, a host containing ".<domain>" for one of
+    `allowed_domains`, and a path not ending in a blocked extension.
+
+    Blocked extensions are a set lookup on the text after the path's last
+    dot (compound ones such as tar.gz are checked with endswith), so the
+    cost does not grow with the number of extensions.
+    """
+    def __init__(self, allowed_domains=ALLOWED_DOMAINS, blocked_extensions=BLOCKED_EXTENSIONS,
+                 max_url_length=MAX_URL_LENGTH):
+        self.host_markers = tuple(f".{domain.strip().lower()}" for domain in allowed_domains)
+        self.blocked_extensions = frozenset(extension.lower() for extension in blocked_extensions)
+        self.compound_extensions = tuple(
+            f".{extension}" for extension in self.blocked_extensions if "." in extension)
+        self.max_url_length = max_url_length
+
+
+    def is_valid(self, url, data_storage=None):
+        return bool(self.filter_urls([url], data_storage))
+
+
+    def filter_urls(self, urls, data_storage=None):
+        """Return the urls in `urls` that pass every rule, in order."""
+        if data_storage is not None:
+            with data_storage.visited_url_lock:
+                visited = data_storage.visited_url
+                urls = [url for url in urls if url not in visited]
+        return [url for url in urls if self._passes(url)]
+
+
+    def _passes(self, url):
+        if len(url) > self.max_url_length:
+            return False
+        try:
+            parsed = urlparse(url)
+            host = parsed.hostname
+        except ValueError:
+            return False
+        if host is None or parsed.scheme not in ALLOWED_SCHEMES:
+            return False
+        for marker in self.host_markers:
+            if marker in host:
+                break
+        else:
+            return False
+        path = parsed.path.lower()
+        dot = path.rfind(".")
+        if dot >= 0 and path[dot + 1:] in self.blocked_extensions:
+            return False
+        return not (self.compound_extensions and path.endswith(self.compound_extensions))